@@ -1,5 +1,3 @@
-from src.gui import GUI
-
 import logging, logging.handlers
 import os
 import sys
@@ -31,7 +29,13 @@ def init_logger():
 
 if __name__ == "__main__":
     debug = False
-    if "-d" in sys.argv:
+    if "-d" in sys.argv or "--debug" in sys.argv:
         debug = True
-    
-    gui = GUI(init_logger())
\ No newline at end of file
+
+    # The GUI is only imported when needed so headless renders never load Tk
+    if len(sys.argv) > 1 and sys.argv[1] in ("render", "watch", "worker"):
+        from src.cli import main
+        sys.exit(main(init_logger(), sys.argv[1:]))
+
+    from src.gui import GUI
+    gui = GUI(init_logger())
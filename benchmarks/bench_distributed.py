@@ -0,0 +1,196 @@
+'''
+Distributed render benchmark.
+
+Starts a Coordinator and several Workers on 127.0.0.1, each worker in its
+own thread, and has them encode a generated photo folder. One extra worker
+drops its connection in the middle of its first segment, so the run also
+exercises requeueing. Reports the wall time and frames/sec and checks that
+every segment was returned with the right number of frames, that the
+dropped segment was retried and finished by a worker, and that the render
+needed no more attempts than that. Exits with an error if a check failed.
+
+Examples:
+    python benchmarks/bench_distributed.py
+    python benchmarks/bench_distributed.py --workers 4 --frames 400 --segment-frames 25
+'''
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.distributed import Coordinator, ProtocolError, Worker, send_message
+from src.events import RenderMetrics
+from src.outputs import OutputTarget
+from src.render_control import RenderControl
+
+from bench_render import generate_dataset, parse_resolution
+
+import argparse
+import logging
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import cv2
+
+class RecordingCoordinator(Coordinator):
+    '''
+    Coordinator that remembers every failed attempt and every segment's
+    result, for the checks.
+    '''
+    def render(self, tasks, segment_filenames, metrics, control):
+        self.failures = []
+        self.results = {}
+        super().render(tasks, segment_filenames, metrics, control)
+
+    def task_failed(self, idx, name, reason):
+        self.failures.append((idx, name, reason))
+        super().task_failed(idx, name, reason)
+
+    def task_done(self, idx, result):
+        self.results[idx] = result
+        super().task_done(idx, result)
+
+class DroppingWorker(Worker):
+    '''
+    Worker that hangs up after a heartbeat on its first segment, like a
+    machine that goes away mid-job, then reconnects and works normally.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dropped = threading.Event()
+
+    def encode(self, task, segment_dir, sock):
+        if self.dropped.is_set():
+            return super().encode(task, segment_dir, sock)
+
+        send_message(sock, {'type': 'heartbeat', 'frames': 0})
+        sock.shutdown(socket.SHUT_RDWR)
+        self.dropped.set()
+        raise ProtocolError(f"dropped segment {task['segment']}")
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_tasks(folder, cfg, target, segment_frames):
+    filenames = sorted(name for name in os.listdir(folder) if not name.startswith('.'))
+    targets = [[list(target.dimensions), target.video_format, target.suffix]]
+    return [{'cfg': cfg.d,
+             'folder': folder,
+             'filenames': filenames[start:start + segment_frames],
+             'targets': targets,
+             'skip head': 0,
+             'skip tail': 0}
+            for start in range(0, len(filenames), segment_frames)]
+
+def count_frames(filename):
+    capture = cv2.VideoCapture(filename)
+    try:
+        count = 0
+        while capture.grab():
+            count += 1
+        return count
+    finally:
+        capture.release()
+
+def run_workers_in_threads(logger, address, count, dropper):
+    '''
+    Starts the dropping worker, then `count` normal ones once it has
+    dropped, so the dropped segment has to be finished by another worker
+    or by the dropper after it reconnects.
+    '''
+    def run_dropper():
+        dropper.run(once=True)
+
+    def run_worker():
+        dropper.dropped.wait()
+        Worker(logger, address, retry_interval=0.2).run(once=True)
+
+    threads = [threading.Thread(target=run_dropper, daemon=True)]
+    threads += [threading.Thread(target=run_worker, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def check(coordinator, tasks, segment_filenames, dropper):
+    problems = []
+    for idx, task in enumerate(tasks):
+        expected = len(task['filenames'])
+        result = coordinator.results.get(idx)
+        if result is None:
+            problems.append(f"segment {idx} never arrived")
+            continue
+        if result['frames'] != expected:
+            problems.append(f"segment {idx}: worker reported {result['frames']} frames, expected {expected}")
+        written = count_frames(segment_filenames[idx][0])
+        if written != expected:
+            problems.append(f"segment {idx}: received file has {written} frames, expected {expected}")
+
+    if not dropper.dropped.is_set():
+        problems.append("the dropping worker never got a segment")
+    if len(coordinator.failures) != 1:
+        problems.append(f"expected 1 failed attempt, got {len(coordinator.failures)}: {coordinator.failures}")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and check a distributed render on localhost.")
+    parser.add_argument("--workers", type=int, default=3,
+                        help="workers besides the one that drops a segment (default: 3)")
+    parser.add_argument("--frames", type=int, default=120,
+                        help="photos to render (default: 120)")
+    parser.add_argument("--segment-frames", type=int, default=15,
+                        help="frames per segment (default: 15)")
+    parser.add_argument("--resolution", default="640x480",
+                        help="size of the generated photos and the video (default: 640x480)")
+    parser.add_argument("--format", default="avi(raw)",
+                        help="output format (default: avi(raw))")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the coordinator and workers")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(threadName)s %(levelname)s %(message)s")
+    logger = logging.getLogger("bench_distributed")
+
+    data_dir = tempfile.mkdtemp(prefix="lapse-bench-")
+    try:
+        resolution = parse_resolution(args.resolution)
+        print(f"Generating {args.frames} frames at {resolution[0]}x{resolution[1]}...")
+        folder = generate_dataset(data_dir, args.frames, resolution, png_ratio=0)
+
+        cfg = Config({'input folder': folder, 'output folder': data_dir, 'output format': args.format})
+        target = OutputTarget(resolution, args.format)
+        tasks = make_tasks(folder, cfg, target, args.segment_frames)
+        segment_filenames = [[os.path.join(data_dir, f"segment_{idx:05d}.{target.extension}")]
+                             for idx in range(len(tasks))]
+
+        address = ("127.0.0.1", get_free_port())
+        coordinator = RecordingCoordinator(logger, address, max_attempts=2)
+        dropper = DroppingWorker(logger, address, retry_interval=0.2)
+        metrics = RenderMetrics()
+        metrics.start(args.frames)
+
+        start = time.perf_counter()
+        threads = run_workers_in_threads(logger, address, args.workers, dropper)
+        coordinator.render(tasks, segment_filenames, metrics, RenderControl())
+        seconds = time.perf_counter() - start
+        for thread in threads:
+            thread.join(timeout=5)
+
+        print(f"{len(tasks)} segments on {args.workers + 1} workers: {seconds:.2f}s, "
+              f"{args.frames / seconds:.1f} fps, {len(coordinator.failures)} retried")
+        problems = check(coordinator, tasks, segment_filenames, dropper)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("ok")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+'''
+Render pipeline benchmark.
+
+Generates synthetic photo folders, renders each one in every format from
+utils.format_dict and reports frames/sec, peak RSS, RSS growth once the
+render is in steady state, frame buffer allocations and the time spent per
+stage (scan, decode, resize, encode). Every render runs in a fresh process
+so peak RSS belongs to that render alone. A render that fails is reported
+as FAILED, left out of the baseline comparison, and makes the command exit
+with an error.
+
+Examples:
+    python benchmarks/bench_render.py --output results.json
+    python benchmarks/bench_render.py --baseline baseline.json
+    python benchmarks/bench_render.py --counts 500 --resolutions 6000x4000 --save-baseline baseline.json
+    python benchmarks/bench_render.py --counts 100000 --unique-frames 200 --formats "avi(raw)"
+'''
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import Config
+from src.events import RenderMetrics
+from src.time_lapse_creator import TimeLapseCreator
+from src.utils import format_dict
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def make_frame(idx, width, height, rng):
+    # Smooth gradient, a moving block and some noise: compresses like a photo, not like a flat fill
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = (x * 0.5 + y * 0.5 + idx * 3) % 256
+
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = base
+    img[..., 1] = (base + 85) % 256
+    img[..., 2] = (base + 170) % 256
+
+    size = max(8, min(width, height) // 6)
+    left = (idx * 37) % max(1, width - size)
+    top = (idx * 23) % max(1, height - size)
+    img[top:top + size, left:left + size] = (255, 255, 255)
+
+    noise = rng.integers(0, 24, size=(height, width, 1), dtype=np.uint8)
+    return cv2.add(img, np.repeat(noise, 3, axis=2))
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def generate_dataset(data_dir, count, resolution, png_ratio, unique=None, seed=0):
+    '''
+    Writes count frames. With `unique`, only that many distinct frames are
+    encoded and the rest are hard links to them, so very long runs are cheap
+    to set up.
+    '''
+    width, height = resolution
+    unique = min(unique or count, count)
+    folder = os.path.join(data_dir, f"{count}_{width}x{height}_png{round(png_ratio * 100)}_u{unique}")
+    marker = os.path.join(folder, ".complete")
+    if os.path.exists(marker):
+        return folder
+
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    png_every = round(1 / png_ratio) if png_ratio > 0 else 0
+
+    written = []
+    for idx in range(count):
+        if idx >= unique:
+            source = written[idx % unique]
+            link_or_copy(source, os.path.join(folder, f"frame_{idx:06d}{os.path.splitext(source)[1]}"))
+            continue
+
+        img = make_frame(idx, width, height, rng)
+        if png_every and idx % png_every == 0:
+            filename = os.path.join(folder, f"frame_{idx:06d}.png")
+            cv2.imwrite(filename, img)
+        else:
+            filename = os.path.join(folder, f"frame_{idx:06d}.jpg")
+            cv2.imwrite(filename, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        written.append(filename)
+
+    open(marker, 'w').close()
+    return folder
+
+def get_peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def get_current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def get_rss_growth(samples):
+    '''
+    RSS added between 10% of the frames and the end of the render. Buffers
+    are all allocated by then, so anything here is per-frame churn or a leak.
+    '''
+    samples = [(frames, rss) for frames, rss in samples if rss is not None]
+    if len(samples) < 2:
+        return None
+
+    last_frames = samples[-1][0]
+    steady = next((rss for frames, rss in samples if frames >= last_frames * 0.1), samples[0][1])
+    return samples[-1][1] - steady
+
+def run_case(case):
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        cfg = Config(dict(case['config'], **{
+            'input folder': case['input folder'],
+            'output folder': output_folder,
+            'output format': case['format'],
+        }))
+
+        metrics = RenderMetrics(interval=1.0)
+        rss_samples = []
+        metrics.subscribe(lambda event: rss_samples.append((event['frames_done'], get_current_rss_bytes()))
+                          if event.kind == 'progress' else None)
+        creator = TimeLapseCreator(logger, cfg, metrics)
+
+        start = time.perf_counter()
+        succeeded = creator.run()
+        seconds = time.perf_counter() - start
+
+        output_bytes = sum(os.path.getsize(os.path.join(output_folder, name))
+                           for name in os.listdir(output_folder))
+
+    return {
+        'succeeded': succeeded,
+        'seconds': seconds,
+        'stages': creator.metrics.timings.as_dict(),
+        'bytes_read': creator.metrics.bytes_read,
+        'allocations': creator.metrics.allocations,
+        'peak_rss_bytes': get_peak_rss_bytes(),
+        'rss_growth_bytes': get_rss_growth(rss_samples),
+        'output_bytes': output_bytes,
+    }
+
+def run_isolated(pool_context, case):
+    with pool_context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (case,))
+
+def compare(results, baseline, tolerance):
+    baseline_by_case = {result['case']: result for result in baseline['results']}
+    regressions = []
+
+    for result in results:
+        previous = baseline_by_case.get(result['case'])
+        # Failed renders are reported by main, their timings mean nothing
+        if not previous or not result['succeeded'] or not previous.get('succeeded', True):
+            continue
+
+        if result['fps'] < previous['fps'] * (1 - tolerance):
+            regressions.append(f"{result['case']}: {result['fps']:.1f} fps, baseline {previous['fps']:.1f} fps")
+
+        if result['peak_rss_bytes'] and previous.get('peak_rss_bytes') and \
+                result['peak_rss_bytes'] > previous['peak_rss_bytes'] * (1 + tolerance):
+            regressions.append(f"{result['case']}: peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB, "
+                               f"baseline {previous['peak_rss_bytes'] / 2**20:.0f} MiB")
+
+    return regressions
+
+def print_result(result):
+    if not result['succeeded']:
+        print(f"{result['case']:<40} FAILED after {result['seconds']:.2f}s")
+        return
+
+    stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in sorted(result['stages'].items()))
+    rss = f"{result['peak_rss_bytes'] / 2**20:.0f} MiB" if result['peak_rss_bytes'] else "n/a"
+    growth = f"{result['rss_growth_bytes'] / 2**20:+.0f} MiB" if result['rss_growth_bytes'] is not None else "n/a"
+    print(f"{result['case']:<40} {result['fps']:8.1f} fps  rss {rss:>9} (steady {growth})  "
+          f"{result['allocations']} buffers  [{stages}]")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the time lapse render pipeline.")
+    parser.add_argument("--counts", default="100",
+                        help="comma separated frame counts (default: 100)")
+    parser.add_argument("--resolutions", default="1920x1080,4000x3000",
+                        help="comma separated source resolutions (default: 1920x1080,4000x3000)")
+    parser.add_argument("--unique-frames", type=int,
+                        help="only generate this many distinct frames and hard link the rest (default: all distinct)")
+    parser.add_argument("--png-ratio", type=float, default=0.2,
+                        help="fraction of frames stored as PNG instead of JPEG (default: 0.2)")
+    parser.add_argument("--formats", default=",".join(format_dict),
+                        help="comma separated output formats (default: all)")
+    parser.add_argument("--output-size", type=parse_resolution, default=(1920, 1080),
+                        help="maximum output resolution (default: 1920x1080)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=JSON",
+                        help="override a Config key, e.g. --set 'decode workers=1'")
+    parser.add_argument("--data-dir",
+                        help="where to keep generated photos between runs (default: a temp dir, removed afterwards)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed slowdown / memory growth against the baseline (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    config = {
+        'output width': args.output_size[0],
+        'output height': args.output_size[1],
+    }
+    for override in args.set:
+        key, value = override.split('=', 1)
+        config[key] = json.loads(value)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="lapse-bench-")
+    pool_context = multiprocessing.get_context("spawn")
+
+    results = []
+    try:
+        for count in [int(count) for count in args.counts.split(',')]:
+            for resolution in [parse_resolution(text) for text in args.resolutions.split(',')]:
+                print(f"Generating {count} frames at {resolution[0]}x{resolution[1]}...")
+                folder = generate_dataset(data_dir, count, resolution, args.png_ratio, args.unique_frames)
+
+                for video_format in args.formats.split(','):
+                    case = {
+                        'input folder': folder,
+                        'format': video_format,
+                        'config': config,
+                    }
+                    result = run_isolated(pool_context, case)
+                    result.update({
+                        'case': f"{count}@{resolution[0]}x{resolution[1]}/{video_format}",
+                        'frames': count,
+                        'fps': count / result['seconds'] if result['seconds'] else 0.0,
+                    })
+                    results.append(result)
+                    print_result(result)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'config': config,
+            'png_ratio': args.png_ratio,
+        },
+        'results': results,
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    failed = [result['case'] for result in results if not result['succeeded']]
+    if failed:
+        print(f"\nFailed renders: {', '.join(failed)}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        if not failed:
+            print("\nNo regressions against baseline.")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+'''
+Startup benchmark.
+
+Imports each entry point in a fresh interpreter and reports how long the
+imports took, the median over several runs, plus the whole process' wall
+time. A case fails if its median import time is over budget, or if it
+loaded one of the heavy libraries that should only load once a render or
+the photo preview needs them (cv2, numpy, PIL, ttkthemes). The command
+exits with an error if any case failed, so import regressions can be caught
+in CI.
+
+Examples:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 20 --output startup.json
+    python benchmarks/bench_startup.py --budget-scale 2 --importtime
+'''
+import os
+import sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import json
+import statistics
+import subprocess
+import time
+
+HEAVY_MODULES = ["cv2", "numpy", "PIL", "ttkthemes"]
+
+# name -> (statement to time, import budget in ms)
+CASES = {
+    "cli": ("import src.cli; src.cli.build_parser()", 150),
+    "gui": ("import src.gui", 150),
+    "render": ("import src.time_lapse_creator", 100),
+}
+
+CHILD = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+def run_case(statement):
+    code = CHILD.format(root=ROOT, statement=statement, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['wall'] = time.perf_counter() - start
+    return result
+
+def print_importtime(statement, count=10):
+    '''
+    The slowest imports of statement by cumulative time, from python -X importtime.
+    '''
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); {statement}"
+    errors = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in errors.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    for microseconds, module in sorted(rows, reverse=True)[:count]:
+        print(f"    {microseconds / 1000:8.1f} ms  {module}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the entry points.")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="fresh interpreters per case (default: 10)")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help=f"comma separated, from {', '.join(CASES)}")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="multiply every budget, e.g. for slow CI machines")
+    parser.add_argument("--importtime", action="store_true",
+                        help="list the slowest imports of every case")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    # Warm the file system cache and .pyc files so the first run isn't an outlier
+    run_case("pass")
+
+    failed = False
+    results = []
+    for name in args.cases.split(','):
+        statement, budget = CASES[name]
+        budget *= args.budget_scale
+
+        runs = [run_case(statement) for _ in range(args.runs)]
+        import_ms = statistics.median(run['seconds'] for run in runs) * 1000
+        wall_ms = statistics.median(run['wall'] for run in runs) * 1000
+        loaded = sorted(set(module for run in runs for module in run['loaded']))
+
+        problems = []
+        if import_ms > budget:
+            problems.append(f"over the {budget:.0f} ms budget")
+        if loaded:
+            problems.append(f"loaded {', '.join(loaded)}")
+        failed = failed or bool(problems)
+
+        print(f"{name:8} import {import_ms:7.1f} ms  process {wall_ms:7.1f} ms  "
+              f"{'FAIL: ' + '; '.join(problems) if problems else 'ok'}")
+        if args.importtime:
+            print_importtime(statement)
+
+        results.append({'case': name,
+                        'import ms': import_ms,
+                        'process ms': wall_ms,
+                        'budget ms': budget,
+                        'heavy modules': loaded})
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'results': results}, f, indent=2)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
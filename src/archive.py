@@ -0,0 +1,242 @@
+import io
+import os
+import struct
+import threading
+import time
+
+# Inputs can be members of a zip or uncompressed tar archive, addressed as
+# <archive path>/<member name>, the same way a file in a folder would be.
+# Members are read in place, nothing is extracted. zipfile and tarfile are
+# only imported once an archive is actually used.
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+ZIP_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+ZIP_STORED = 0
+ZIP_ENCRYPTED_FLAG = 0x1
+
+# gzip, bzip2, xz and zstd magic numbers
+COMPRESSED_MAGIC = [b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00', b'\x28\xb5\x2f\xfd']
+
+def is_archive(path):
+    if not os.path.isfile(path):
+        return False
+
+    import tarfile
+    import zipfile
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+def normalize_member_name(name):
+    while name.startswith('./'):
+        name = name[2:]
+    return name.lstrip('/')
+
+def is_hidden(name):
+    # Same files a folder scan skips, plus the resource forks macOS adds to zips
+    return any(part.startswith('.') or part == '__MACOSX' for part in name.split('/'))
+
+class MemberFile(io.RawIOBase):
+    '''
+    Read-only, seekable view of `size` bytes at `offset` in a file, with its
+    own file handle so threads can read members concurrently.
+    '''
+    def __init__(self, path, offset, size):
+        self.file = open(path, 'rb', buffering=0)
+        self.offset = offset
+        self.member_size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.member_size - self.position)
+        if count <= 0:
+            return 0
+        self.file.seek(self.offset + self.position)
+        count = self.file.readinto(memoryview(buffer)[:count])
+        self.position += count
+        return count
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += self.member_size
+        self.position = max(0, position)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+class ZipArchive:
+    '''
+    Members are listed from the central directory. Stored (uncompressed)
+    members, which is how cameras' JPEGs usually end up in a zip, are read
+    straight from their offset; compressed ones go through zipfile.
+    '''
+    def __init__(self, path):
+        import zipfile
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.infos = {normalize_member_name(info.filename): info for info in self.zip.infolist()
+                      if not info.is_dir() and not is_hidden(normalize_member_name(info.filename))}
+        self.data_offsets = {}
+
+    def stat(self, name):
+        '''
+        (byte size, mtime) of a member.
+        '''
+        info = self.infos[name]
+        return info.file_size, time.mktime(info.date_time + (0, 0, -1))
+
+    def members(self):
+        '''
+        (name, byte size, mtime) of every file in the archive.
+        '''
+        return [(name, *self.stat(name)) for name in self.infos]
+
+    def get_data_offset(self, info):
+        offset = self.data_offsets.get(info.header_offset)
+        if offset is None:
+            with open(self.path, 'rb') as f:
+                f.seek(info.header_offset)
+                signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+            if signature != ZIP_LOCAL_HEADER_SIGNATURE:
+                raise IOError(f"Bad local header for {info.filename} in {self.path}")
+            offset = self.data_offsets[info.header_offset] = \
+                info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+        return offset
+
+    def open(self, name):
+        info = self.infos[name]
+        if info.compress_type == ZIP_STORED and not info.flag_bits & ZIP_ENCRYPTED_FLAG:
+            return MemberFile(self.path, self.get_data_offset(info), info.file_size)
+
+        f = self.zip.open(info)
+        f.member_size = info.file_size
+        return f
+
+class TarArchive:
+    '''
+    Members of an uncompressed tar are contiguous, so each is read from its
+    data offset. Compressed tars can only be read front to back, which
+    doesn't fit random access to frames, and are rejected.
+    '''
+    def __init__(self, path):
+        import tarfile
+        self.path = path
+        with open(path, 'rb') as f:
+            magic = f.read(6)
+        if any(magic.startswith(prefix) for prefix in COMPRESSED_MAGIC):
+            raise ValueError(f"{path} is a compressed tar archive; only uncompressed .tar and .zip archives "
+                             f"can be read without extracting them")
+
+        with tarfile.open(path, 'r:') as tar:
+            self.infos = {normalize_member_name(info.name): (info.offset_data, info.size, info.mtime)
+                          for info in tar.getmembers()
+                          if info.isfile() and not info.issparse() and not is_hidden(normalize_member_name(info.name))}
+
+    def stat(self, name):
+        _, size, mtime = self.infos[name]
+        return size, mtime
+
+    def members(self):
+        return [(name, size, mtime) for name, (_, size, mtime) in self.infos.items()]
+
+    def open(self, name):
+        offset, size, _ = self.infos[name]
+        return MemberFile(self.path, offset, size)
+
+archives = {}  # absolute path -> ((size, mtime), archive)
+archives_lock = threading.Lock()
+
+def open_archive(path, check=True):
+    '''
+    Returns the shared ZipArchive or TarArchive for path. The member list is
+    read once and read again only if check is set and the archive's size or
+    mtime changed.
+    '''
+    key = os.path.abspath(path)
+    with archives_lock:
+        cached = archives.get(key)
+        if cached and not check:
+            return cached[1]
+
+        stat = os.stat(key)
+        version = (stat.st_size, stat.st_mtime_ns)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        import zipfile
+        archive = ZipArchive(key) if zipfile.is_zipfile(key) else TarArchive(key)
+        archives[key] = (version, archive)
+        return archive
+
+def find_member(path):
+    '''
+    (archive, member name) if path is <archive>/<member>, else None.
+    '''
+    path = os.path.abspath(path)
+
+    # Archives that are already open are found without touching the disk
+    parent, name = os.path.split(path)
+    while name and parent not in archives:
+        parent, name = os.path.split(parent)
+
+    if name:
+        archive = open_archive(parent, check=False)
+    else:
+        parent, name = os.path.split(path)
+        while name and not os.path.exists(parent):
+            parent, name = os.path.split(parent)
+        if not name or not is_archive(parent):
+            return None
+        archive = open_archive(parent)
+
+    member = os.path.relpath(path, parent).replace(os.sep, '/')
+    return (archive, member) if member in archive.infos else None
+
+def open_input(path, buffering=0):
+    '''
+    Opens an input photo for binary reading, whether it's a file or an
+    archive member. Unbuffered by default, for reading whole files with
+    readinto; pass buffering=-1 for many small reads.
+    '''
+    try:
+        return open(path, 'rb', buffering=buffering)
+    except (FileNotFoundError, NotADirectoryError):
+        member = find_member(path)
+        if member is None:
+            raise
+        archive, name = member
+        f = archive.open(name)
+        return io.BufferedReader(f) if buffering and isinstance(f, MemberFile) else f
+
+def get_input_size(f):
+    '''
+    Byte size of a file returned by open_input.
+    '''
+    size = getattr(f, 'member_size', None)
+    return size if size is not None else os.fstat(f.fileno()).st_size
+
+def stat_input(path):
+    '''
+    (byte size, mtime) of a file or archive member.
+    '''
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+    except (FileNotFoundError, NotADirectoryError):
+        member = find_member(path)
+        if member is None:
+            raise
+        archive, name = member
+        return archive.stat(name)
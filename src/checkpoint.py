@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+
+def hash_inputs(entries):
+    '''
+    Fingerprint of the ordered input frames (name, byte size, mtime).
+    '''
+    frames = [[entry.name, entry.size, entry.mtime] for entry in entries]
+    return hashlib.sha1(json.dumps(frames).encode("utf-8")).hexdigest()
+
+def chunk_filename(chunk_dir, idx, target):
+    return os.path.join(chunk_dir, f"chunk_{idx:05d}{target.suffix}.{target.extension}")
+
+class Checkpoint:
+    '''
+    Progress of a chunked render, stored in the chunk folder next to the
+    output. Only chunks whose writers were released are listed, each with
+    its frame count and the byte size of its file per output target.
+    '''
+    version = 1
+    filename = "checkpoint.json"
+
+    def __init__(self, settings, inputs_hash, chunk_frames, chunks=None):
+        self.settings = settings
+        self.inputs_hash = inputs_hash
+        self.chunk_frames = chunk_frames
+        self.chunks = chunks or []
+
+    @staticmethod
+    def dir_for(output_filename):
+        return f"{output_filename}.chunks"
+
+    @classmethod
+    def load(cls, chunk_dir):
+        try:
+            with open(os.path.join(chunk_dir, cls.filename)) as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if d.get('version') != cls.version:
+            return None
+
+        return cls(d['settings'], d['inputs'], d['chunk frames'], d['chunks'])
+
+    def save(self, chunk_dir):
+        path = os.path.join(chunk_dir, self.filename)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({'version': self.version,
+                       'settings': self.settings,
+                       'inputs': self.inputs_hash,
+                       'chunk frames': self.chunk_frames,
+                       'chunks': self.chunks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def matches(self, settings, inputs_hash, chunk_frames):
+        return self.settings == settings and self.inputs_hash == inputs_hash and self.chunk_frames == chunk_frames
+
+    def frames_done(self):
+        return sum(frames for frames, _ in self.chunks)
+
+    def count_valid(self, chunk_dir, targets):
+        '''
+        Number of leading chunks whose files are all still there with the
+        size they had when they were finished.
+        '''
+        for idx, (_, sizes) in enumerate(self.chunks):
+            for target, size in zip(targets, sizes):
+                try:
+                    if os.path.getsize(chunk_filename(chunk_dir, idx, target)) != size:
+                        return idx
+                except OSError:
+                    return idx
+
+        return len(self.chunks)
+
+def sync_file(path):
+    '''
+    Flushes a finished chunk to disk before the checkpoint lists it.
+    '''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,331 @@
+from .archive import is_archive, open_archive
+from .config import Config
+from .distributed import parse_address, run_workers
+from .folder_index import SORT_METHODS
+from .events import JsonReport, RenderMetrics
+from .time_lapse_creator import TimeLapseCreator
+from .utils import format_dict
+from .video_writer import encoders, find_ffmpeg
+from .watcher import LiveRenderer
+
+import argparse
+import os
+import sys
+
+# Headless entry point. Nothing imported here may pull in tkinter, PIL.ImageTk
+# or ttkthemes, so renders can run on machines without a display server.
+
+def parse_extra_output(text):
+    '''
+    WIDTHxHEIGHT or WIDTHxHEIGHT:FORMAT, e.g. 854x480:mp4
+    '''
+    size, _, video_format = text.partition(':')
+    try:
+        width, height = (int(value) for value in size.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected WIDTHxHEIGHT[:FORMAT]: "{text}"')
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f'width and height must be positive: "{text}"')
+    if video_format and video_format not in format_dict:
+        raise argparse.ArgumentTypeError(f'unknown format "{video_format}", choose from {", ".join(format_dict)}')
+
+    output = {'width': width, 'height': height}
+    if video_format:
+        output['format'] = video_format
+    return output
+
+def parse_white_balance(text):
+    '''
+    RED,GREEN,BLUE gains, e.g. 1.1,1,0.9
+    '''
+    try:
+        gains = [float(value) for value in text.split(',')]
+    except ValueError:
+        gains = []
+    if len(gains) != 3 or any(gain <= 0 for gain in gains):
+        raise argparse.ArgumentTypeError(f'expected three positive RED,GREEN,BLUE gains: "{text}"')
+    return gains
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class ProgressReporter:
+    '''
+    Subscriber that keeps a one-line progress display on the terminal.
+    '''
+    def __init__(self, logger, stream=sys.stderr):
+        self.logger = logger
+        self.stream = stream
+        self.line_open = False
+
+    def __call__(self, event):
+        if event.kind == 'progress':
+            self.stream.write(f"\rRendering: {event['percent']:5.1f}% "
+                              f"{event['frames_done']}/{event['total_frames']} frames, "
+                              f"{event['fps']:.1f} fps, ETA {format_seconds(event['eta'])}  ")
+            self.stream.flush()
+            self.line_open = True
+        elif event.kind == 'slow_frame':
+            self.logger.debug(f"Slow {event['stage']}: {event['filename']} took {event['seconds']:.2f}s "
+                              f"(typical {event['typical']:.2f}s)")
+        elif event.kind == 'finish':
+            if self.line_open:
+                self.stream.write("\n")
+                self.line_open = False
+            stages = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in sorted(event['stages'].items()))
+            self.logger.debug(f"{event['frames_done']} frames in {event['elapsed']:.1f}s "
+                              f"({event['fps']:.1f} fps). {stages}")
+
+def parse_address_argument(text):
+    try:
+        return parse_address(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def add_token_argument(parser):
+    parser.add_argument("--token", default=os.environ.get("LAPSE_WORKER_TOKEN", ""),
+                        help="shared secret workers must present (default: $LAPSE_WORKER_TOKEN)")
+
+def add_render_arguments(parser):
+    defaults = Config.slots
+
+    parser.add_argument("-d", "--debug", action="store_true",
+                        help="log debug output to stdout")
+    parser.add_argument("--input", required=True,
+                        help="folder containing the photos, or a zip or uncompressed tar archive of them")
+    parser.add_argument("--output", default=os.getcwd(),
+                        help="folder to write the video to (default: current directory)")
+    parser.add_argument("--output-file",
+                        help="video file name without extension (default: current date and time)")
+    parser.add_argument("--sort", type=lambda text: text.replace('-', ' '), choices=list(SORT_METHODS),
+                        default=defaults['sort method'],
+                        help="frame order: name, or capture-time from EXIF (default: name)")
+    parser.add_argument("--fps", type=float, default=defaults['fps'])
+    parser.add_argument("--length", type=float,
+                        help="target video length in seconds; frames are skipped or interpolated to fit")
+    parser.add_argument("--blend", action="store_true",
+                        help="with --length, average skipped frames together instead of dropping them")
+    parser.add_argument("--width", type=int, default=defaults['output width'])
+    parser.add_argument("--height", type=int, default=defaults['output height'])
+    parser.add_argument("--format", choices=list(format_dict), default=defaults['output format'])
+    parser.add_argument("--encoder", choices=list(encoders), default=defaults['encoder'],
+                        help="opencv, or ffmpeg to encode with an ffmpeg process (default: opencv)")
+    parser.add_argument("--codec", default=defaults['encoder codec'],
+                        help="ffmpeg video encoder, e.g. libx264, libx265, libsvtav1 (default: libx264)")
+    parser.add_argument("--preset", default=defaults['encoder preset'],
+                        help="ffmpeg encoder preset (default: medium)")
+    parser.add_argument("--crf", type=int, default=defaults['encoder crf'],
+                        help="ffmpeg constant rate factor, lower is better quality (default: 23)")
+    parser.add_argument("--encoder-threads", type=int, default=defaults['encoder threads'],
+                        help="ffmpeg encoder threads, 0 picks automatically (default: 0)")
+    parser.add_argument("--decode-workers", type=int, default=defaults['decode workers'])
+    parser.add_argument("--prefetch-depth", type=int, default=defaults['prefetch depth'])
+    parser.add_argument("--segment-workers", type=int, default=defaults['segment workers'])
+    parser.add_argument("--distributed", metavar="HOST:PORT",
+                        help="listen on this address and have `worker` processes encode the segments "
+                             "(requires ffmpeg; the input folder must be reachable from every worker)")
+    parser.add_argument("--distributed-segment-frames", type=int, default=defaults['distributed segment frames'],
+                        help="frames per segment handed to a worker (default: 250)")
+    add_token_argument(parser)
+    parser.add_argument("--dedupe", action="store_true",
+                        help="skip frames that are nearly identical to the previous frame")
+    parser.add_argument("--dedupe-threshold", type=int, default=defaults['dedupe threshold'],
+                        help="max differing bits (of 64) for a frame to count as a duplicate")
+    parser.add_argument("--deflicker", action="store_true",
+                        help="smooth out exposure changes between frames")
+    parser.add_argument("--deflicker-window", type=int, default=defaults['deflicker window'],
+                        help="number of frames to average exposure over")
+    parser.add_argument("--gamma", type=float, default=defaults['grade gamma'],
+                        help="gamma correction, above 1 brightens the midtones (default: 1)")
+    parser.add_argument("--white-balance", type=parse_white_balance, default=defaults['grade white balance'],
+                        metavar="RED,GREEN,BLUE", help="per-channel gains (default: 1,1,1)")
+    parser.add_argument("--contrast", type=float, default=defaults['grade contrast'],
+                        help="S-curve contrast from -1 to 1 (default: 0)")
+    parser.add_argument("--saturation", type=float, default=defaults['grade saturation'],
+                        help="0 is greyscale, 1 leaves colours alone (default: 1)")
+    parser.add_argument("--report",
+                        help="write a JSON report with stage timings and slow frames to this file")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not print progress")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="TimeLapse.py",
+                                     description="Create time lapses without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render_parser = commands.add_parser("render", help="render a folder of photos once")
+    add_render_arguments(render_parser)
+    render_parser.add_argument("--incremental", action="store_true",
+                               help="only encode frames added since the last render of --output-file")
+    render_parser.add_argument("--checkpoint", action="store_true",
+                               help="render in finished chunks so an interrupted render resumes where it stopped")
+    render_parser.add_argument("--checkpoint-frames", type=int, default=Config.slots['checkpoint frames'],
+                               help="frames per chunk with --checkpoint (default: 2000)")
+    render_parser.add_argument("--draft", action="store_true",
+                               help="quickly render a small, low frame count proxy of the video to <name>_draft.avi")
+    render_parser.add_argument("--extra-output", type=parse_extra_output, action="append", default=[],
+                               metavar="WIDTHxHEIGHT[:FORMAT]",
+                               help="also write a smaller copy from the same decoded frames, e.g. 854x480:mp4; "
+                                    "can be repeated")
+
+    watch_parser = commands.add_parser("watch", help="keep appending new photos to a video as they arrive")
+    add_render_arguments(watch_parser)
+    watch_parser.add_argument("--publish-interval", type=float, default=600,
+                              help="seconds between updates of the output video (default: 600)")
+    watch_parser.add_argument("--poll-interval", type=float, default=2.0,
+                              help="seconds between folder checks when inotify is unavailable (default: 2)")
+
+    worker_parser = commands.add_parser("worker", help="encode segments for a render started with --distributed")
+    worker_parser.add_argument("-d", "--debug", action="store_true",
+                               help="log debug output to stdout")
+    worker_parser.add_argument("--connect", type=parse_address_argument, required=True, metavar="HOST:PORT",
+                               help="address the render is listening on")
+    worker_parser.add_argument("--input",
+                               help="where the input folder is mounted on this machine, "
+                                    "if not at the same path as on the coordinator")
+    worker_parser.add_argument("--processes", type=int, default=1,
+                               help="number of segments to encode at once (default: 1)")
+    add_token_argument(worker_parser)
+
+    return parser
+
+def validate_args(parser, args):
+    if is_archive(args.input):
+        if args.command == "watch":
+            parser.error("watch needs a folder, an archive can't receive new photos")
+        try:
+            open_archive(args.input)
+        except Exception as e:
+            parser.error(str(e))
+    elif not os.path.isdir(args.input):
+        parser.error(f'input folder does not exist: "{args.input}"')
+    if not os.path.isdir(args.output):
+        parser.error(f'output folder does not exist: "{args.output}"')
+    if args.distributed:
+        try:
+            parse_address(args.distributed)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.distributed_segment_frames <= 0:
+        parser.error("--distributed-segment-frames must be a positive number")
+    if args.gamma <= 0:
+        parser.error(f'gamma must be a positive number: "{args.gamma}"')
+    if not -1 <= args.contrast <= 1:
+        parser.error(f'contrast must be between -1 and 1: "{args.contrast}"')
+    if args.saturation < 0:
+        parser.error(f'saturation can\'t be negative: "{args.saturation}"')
+    if args.length is not None and args.length <= 0:
+        parser.error(f'length must be a positive number: "{args.length}"')
+    if args.length is not None and args.command == "watch":
+        parser.error("--length can't be used with watch, the video keeps growing")
+    if args.command == "watch" and not find_ffmpeg():
+        parser.error("watch needs ffmpeg on the PATH to join new frames onto the video")
+    if args.fps <= 0:
+        parser.error(f'fps must be a positive number: "{args.fps}"')
+    if args.width <= 0 or args.height <= 0:
+        parser.error("video width and height must be positive numbers")
+    if (args.command == "watch" or getattr(args, "incremental", False)) and not args.output_file:
+        parser.error("--output-file is required so the same video is updated each run")
+    if getattr(args, "checkpoint", False) and not args.output_file:
+        parser.error("--output-file is required with --checkpoint so a rerun finds the earlier chunks")
+    outputs = [{'width': args.width, 'height': args.height, 'format': args.format}] + \
+        getattr(args, "extra_output", [])
+    for output in outputs:
+        if (output['width'] > 4096 or output['height'] > 4096) and \
+                output.get('format', args.format) != 'avi(raw)' and args.encoder == 'opencv':
+            parser.error("output format only supports up to 4K videos, use 'avi(raw)' or --encoder ffmpeg "
+                         "for higher resolutions")
+
+def build_config(args):
+    cfg = Config({
+        'input folder': args.input,
+        'output folder': args.output,
+        'fps': args.fps,
+        'sort method': args.sort,
+        'fit to length': args.length is not None,
+        'length': args.length if args.length is not None else Config.slots['length'],
+        'length blend': args.blend,
+        'output width': args.width,
+        'output height': args.height,
+        'output format': args.format,
+        'extra outputs': getattr(args, "extra_output", []),
+        'draft': getattr(args, "draft", False),
+        'checkpoint': getattr(args, "checkpoint", False),
+        'checkpoint frames': getattr(args, "checkpoint_frames", Config.slots['checkpoint frames']),
+        'encoder': args.encoder,
+        'encoder codec': args.codec,
+        'encoder preset': args.preset,
+        'encoder crf': args.crf,
+        'encoder threads': args.encoder_threads,
+        'decode workers': args.decode_workers,
+        'prefetch depth': args.prefetch_depth,
+        'segment workers': args.segment_workers,
+        'distributed address': args.distributed or "",
+        'distributed token': args.token,
+        'distributed segment frames': args.distributed_segment_frames,
+        'dedupe': args.dedupe,
+        'dedupe threshold': args.dedupe_threshold,
+        'deflicker': args.deflicker,
+        'deflicker window': args.deflicker_window,
+        'grade gamma': args.gamma,
+        'grade white balance': args.white_balance,
+        'grade contrast': args.contrast,
+        'grade saturation': args.saturation,
+        'incremental': args.command == "watch" or getattr(args, "incremental", False),
+    })
+
+    if args.output_file:
+        cfg['output file'] = args.output_file
+
+    return cfg
+
+def main(logger, argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        if args.input and not os.path.isdir(args.input):
+            parser.error(f'input folder does not exist: "{args.input}"')
+        logger.info(f"Encoding for {args.connect[0]}:{args.connect[1]}, press Ctrl+C to stop")
+        try:
+            run_workers(logger, args.connect, args.token, args.input, args.processes)
+        except KeyboardInterrupt:
+            logger.info("Stopped worker")
+        return 0
+
+    validate_args(parser, args)
+
+    cfg = build_config(args)
+    logger.debug(f"Render using: {cfg.toJson()}")
+
+    metrics = RenderMetrics()
+    if not args.quiet:
+        metrics.subscribe(ProgressReporter(logger))
+    if args.report:
+        metrics.subscribe(JsonReport(args.report))
+
+    if args.command == "watch":
+        try:
+            LiveRenderer(logger, cfg, metrics,
+                         publish_interval=args.publish_interval,
+                         poll_interval=args.poll_interval).run()
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+        return 0
+
+    try:
+        succeeded = TimeLapseCreator(logger, cfg, metrics).run()
+    except Exception as e:
+        logger.error(f"Failed to create time lapse: {e}")
+        return 1
+
+    if not succeeded:
+        logger.error("Failed to create time lapse.")
+        return 1
+
+    logger.info(f"Created time lapse in {cfg['output folder']}")
+    return 0
@@ -12,8 +12,51 @@ class Config:
         'output height': 1080,
         'output width': 1920,
         'output format': "avi",
+        # More videos to write from the same decoded frames, each a dict with
+        # 'width', 'height' and optionally 'format' and 'name' (file suffix)
+        'extra outputs': [],
+
+        # 'opencv' (cv2.VideoWriter) or 'ffmpeg' (pipe to an ffmpeg process).
+        # The other encoder settings only apply to ffmpeg.
+        'encoder': "opencv",
+        'encoder codec': "libx264",
+        'encoder preset': "medium",
+        'encoder crf': 23,
+        'encoder threads': 0,
 
         'use_loaded_photo_size': True,
+        # 'name' or 'capture time' (EXIF DateTimeOriginal, else mtime)
+        'sort method': "name",
+
+        'decode workers': 4,
+        'prefetch depth': 8,
+        'segment workers': 1,
+        # HOST:PORT to hand segments to `TimeLapse.py worker` processes on,
+        # empty to render on this machine
+        'distributed address': "",
+        'distributed token': "",
+        'distributed segment frames': 250,
+        'distributed attempts': 3,
+        'reduced decode': True,
+        'incremental': False,
+        'checkpoint': False,
+        'checkpoint frames': 2000,
+        'dedupe': False,
+        'dedupe threshold': 4,
+        'deflicker': False,
+        'deflicker window': 15,
+        # Colour grading, applied to every frame after deflicker. White
+        # balance is a (red, green, blue) gain, contrast is -1 .. 1
+        'grade gamma': 1.0,
+        'grade white balance': [1.0, 1.0, 1.0],
+        'grade contrast': 0.0,
+        'grade saturation': 1.0,
+        'draft': False,
+        'draft width': 640,
+        'draft height': 360,
+        'draft max frames': 600,
+        'fit to length': False,
+        'length blend': False,
     }
 
     def __init__(self, args=None):
@@ -0,0 +1,118 @@
+from .frame_reader import imread
+
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import hashlib
+import json
+import numpy as np
+import os
+
+def compute_dhash(path):
+    '''
+    64-bit difference hash: the sign of the horizontal gradient of a 9x8
+    grayscale thumbnail. Decoded at 1/8 resolution, which is plenty for it.
+    '''
+    img = imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hamming_distances(hashes, anchor):
+    diff = np.bitwise_xor(hashes, np.uint64(anchor))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(diff)
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def select_distinct(hashes, threshold, max_batch=4096):
+    '''
+    Returns a keep mask. A frame is kept when its hash differs from the last
+    kept frame's by more than threshold bits. Distances are computed in
+    batches with NumPy; the batch grows while no frame is kept so long runs
+    of duplicates are skipped in a few vectorized steps.
+    '''
+    keep = np.zeros(len(hashes), dtype=bool)
+    if len(hashes) == 0:
+        return keep
+
+    keep[0] = True
+    anchor = 0
+    pos = 1
+    batch_size = 16
+    while pos < len(hashes):
+        distances = hamming_distances(hashes[pos:pos + batch_size], hashes[anchor])
+        over = np.flatnonzero(distances > threshold)
+
+        if len(over) == 0:
+            pos += batch_size
+            batch_size = min(batch_size * 2, max_batch)
+            continue
+
+        anchor = pos + over[0]
+        keep[anchor] = True
+        pos = anchor + 1
+        batch_size = 16
+
+    return keep
+
+class HashCache:
+    '''
+    Per-folder store of frame hashes, keyed by file name and invalidated when
+    the file's byte size or mtime changes.
+    '''
+    cache_dir = os.path.join("cache", "hashes")
+
+    def __init__(self, folder):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.cache_dir, f"{key}.json")
+
+        try:
+            with open(self.path) as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = {}
+
+    def get(self, entry):
+        cached = self.hashes.get(entry.name)
+        if cached and cached[0] == entry.size and cached[1] == entry.mtime:
+            return cached[2]
+        return None
+
+    def put(self, entry, value):
+        self.hashes[entry.name] = [entry.size, entry.mtime, value]
+
+    def save(self):
+        with open(f"{self.path}.tmp", 'w') as f:
+            json.dump(self.hashes, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+def remove_duplicates(entries, folder, threshold, workers=4):
+    '''
+    Returns the entries whose frames are not near-duplicates of the frame
+    before them. Only frames missing from the hash cache are decoded.
+    '''
+    cache = HashCache(folder)
+
+    hashes = [cache.get(entry) for entry in entries]
+    missing = [idx for idx, value in enumerate(hashes) if value is None]
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            computed = pool.map(compute_dhash, [entries[idx].path for idx in missing])
+            for idx, value in zip(missing, computed):
+                if value is not None:
+                    cache.put(entries[idx], value)
+                hashes[idx] = value
+        cache.save()
+
+    # Unreadable frames have no hash; always keep them so the renderer reports them
+    valid = np.array([value is not None for value in hashes], dtype=bool)
+    values = np.array([value if value is not None else 0 for value in hashes], dtype=np.uint64)
+
+    keep = np.ones(len(entries), dtype=bool)
+    keep[valid] = select_distinct(values[valid], threshold)
+
+    return [entry for entry, kept in zip(entries, keep) if kept]
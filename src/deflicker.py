@@ -0,0 +1,80 @@
+from collections import deque
+from itertools import islice
+import cv2
+import numpy as np
+
+class Deflicker:
+    '''
+    Single-pass exposure smoothing.
+
+    Each frame's mean luminance is measured on a 1/8 scale copy. The frame is
+    then scaled towards the mean luminance of the `window` frames centred on
+    it, using one 256-entry LUT. Only window // 2 frames are held back at a
+    time, so memory is O(window) however long the render is.
+    '''
+    def __init__(self, window=15):
+        self.window = max(1, window)
+        self.half = self.window // 2
+        self.levels = np.arange(256, dtype=np.float32)
+
+    def measure(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, width // 8), max(1, height // 8)), interpolation=cv2.INTER_AREA)
+        blue, green, red, _ = cv2.mean(small)
+        return 0.114 * blue + 0.587 * green + 0.299 * red
+
+    def correct(self, frame, luminance, target):
+        gain = target / max(luminance, 1.0)
+        lut = np.clip(self.levels * gain + 0.5, 0, 255).astype(np.uint8)
+        # In place: the frame isn't needed uncorrected once it's measured
+        return cv2.LUT(frame, lut, dst=frame)
+
+    def get_held_frames(self, skip_tail=0):
+        return max(self.half, skip_tail)
+
+    def process(self, frames, skip_head=0, skip_tail=0):
+        '''
+        Yields corrected frames in order. The first skip_head and last
+        skip_tail frames are only used as context for their neighbours and
+        are not yielded, so a segment can be smoothed exactly as it would be
+        inside the full render.
+        '''
+        lums = deque()     # luminance of frames first .. first + len(lums) - 1
+        first = 0
+        pending = deque()  # frames not yielded yet, starting at next_out
+        next_out = 0
+        total = None
+        hold = self.get_held_frames(skip_tail)
+
+        def emit():
+            nonlocal first, next_out
+            frame = pending.popleft()
+            idx = next_out
+            next_out += 1
+
+            if idx >= skip_head and (total is None or idx < total - skip_tail):
+                window = list(islice(lums, max(0, idx - self.half - first), idx + self.half + 1 - first))
+                frame = self.correct(frame, lums[idx - first], sum(window) / len(window))
+            else:
+                frame = None
+
+            while first < next_out - self.half:
+                lums.popleft()
+                first += 1
+
+            return frame
+
+        for frame in frames:
+            lums.append(self.measure(frame))
+            pending.append(frame)
+
+            if len(pending) > hold:
+                frame = emit()
+                if frame is not None:
+                    yield frame
+
+        total = next_out + len(pending)
+        while pending:
+            frame = emit()
+            if frame is not None:
+                yield frame
@@ -0,0 +1,347 @@
+from .config import Config
+from .outputs import OutputTarget
+from .render_control import RenderCancelled
+from .segments import encode_segment
+
+import hmac
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+# Messages are a 4 byte big-endian length followed by that much UTF-8 JSON.
+# A 'result' message is followed by the encoded segment files, back to back,
+# with their byte sizes listed in the message.
+MESSAGE_HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+RECEIVE_CHUNK = 1024 * 1024
+
+# A worker that is silent for this long is treated as lost. Workers send a
+# heartbeat at least every HEARTBEAT_INTERVAL seconds while encoding.
+WORKER_TIMEOUT = 60.0
+HEARTBEAT_INTERVAL = 5.0
+
+class ProtocolError(Exception):
+    pass
+
+def parse_address(text, default_host="127.0.0.1"):
+    '''
+    HOST:PORT or PORT, returned as (host, port).
+    '''
+    host, _, port = text.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f'expected HOST:PORT: "{text}"')
+    if not 0 < port < 65536:
+        raise ValueError(f'port must be between 1 and 65535: "{text}"')
+    return host.strip("[]") or default_host, port
+
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(MESSAGE_HEADER.pack(len(data)) + data)
+
+def receive_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ProtocolError("connection closed")
+        received += count
+    return data
+
+def receive_message(sock):
+    size, = MESSAGE_HEADER.unpack(receive_exact(sock, MESSAGE_HEADER.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"message of {size} bytes is too large")
+    try:
+        return json.loads(receive_exact(sock, size).decode("utf-8"))
+    except ValueError as e:
+        raise ProtocolError(f"malformed message: {e}")
+
+def receive_file(sock, filename, size):
+    with open(filename, 'wb') as f:
+        buffer = bytearray(min(size, RECEIVE_CHUNK) or 1)
+        view = memoryview(buffer)
+        while size > 0:
+            count = sock.recv_into(view[:min(size, len(buffer))])
+            if not count:
+                raise ProtocolError("connection closed while receiving a segment")
+            f.write(view[:count])
+            size -= count
+
+class Coordinator:
+    '''
+    Hands segments of a render to workers that connect over TCP and
+    collects the encoded files they send back. Each connection is served by
+    its own thread and asks for the next segment as soon as it's done, so
+    faster workers take more of the work. A segment whose worker disconnects,
+    goes silent for WORKER_TIMEOUT or reports an error is queued again for
+    any worker, up to max_attempts times.
+
+    Workers read the photos themselves, so the input folder has to be
+    reachable from every worker machine.
+    '''
+    def __init__(self, logger, address, token="", max_attempts=3):
+        self.logger = logger
+        self.address = address
+        self.token = token
+        self.max_attempts = max_attempts
+
+    def authorized(self, hello):
+        return hello.get('type') == 'hello' and hmac.compare_digest(str(hello.get('token', "")), self.token)
+
+    def render(self, tasks, segment_filenames, metrics, control):
+        '''
+        Sends tasks[idx] to a worker and writes the files it returns to
+        segment_filenames[idx]. Returns once every segment is done, raises
+        RuntimeError if a segment failed max_attempts times and
+        RenderCancelled if control is cancelled.
+        '''
+        self.tasks = tasks
+        self.segment_filenames = segment_filenames
+        self.metrics = metrics
+        self.control = control
+        self.pending = list(range(len(tasks)))
+        self.attempts = [0] * len(tasks)
+        self.remaining = len(tasks)
+        self.error = None
+        self.connections = set()
+        self.condition = threading.Condition()
+
+        server = socket.create_server(self.address)
+        server.settimeout(0.5)
+        self.logger.info(f"Waiting for workers on {self.address[0]}:{self.address[1]}")
+
+        threads = []
+        try:
+            while True:
+                with self.condition:
+                    if self.error or not self.remaining:
+                        break
+                if control.is_cancelled():
+                    raise RenderCancelled()
+
+                try:
+                    conn, address = server.accept()
+                except socket.timeout:
+                    continue
+
+                thread = threading.Thread(target=self.serve_worker, args=(conn, address), daemon=True)
+                thread.start()
+                threads.append(thread)
+        finally:
+            server.close()
+            with self.condition:
+                self.remaining = 0
+                self.condition.notify_all()
+                for conn in self.connections:
+                    # Unblocks the worker threads and tells the workers to stop
+                    try:
+                        conn.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+            for thread in threads:
+                thread.join()
+
+        if self.error:
+            raise RuntimeError(self.error)
+
+    def next_task(self):
+        '''
+        Index of the next pending segment, waiting while the remaining ones
+        are with other workers in case one of them is lost. None once the
+        render is over.
+        '''
+        with self.condition:
+            while self.remaining and not self.pending and not self.error:
+                self.condition.wait()
+            if not self.remaining or self.error:
+                return None
+            return self.pending.pop(0)
+
+    def task_failed(self, idx, name, reason):
+        with self.condition:
+            self.attempts[idx] += 1
+            if self.attempts[idx] >= self.max_attempts:
+                self.error = f"Segment {idx} failed {self.attempts[idx]} times, last on {name}: {reason}"
+            else:
+                self.logger.warning(f"Segment {idx} failed on {name}, retrying: {reason}")
+                self.pending.insert(0, idx)
+            self.condition.notify_all()
+
+    def task_done(self, idx, result):
+        with self.condition:
+            self.remaining -= 1
+            # RenderMetrics expects a single writer thread, so connection
+            # threads report one at a time
+            self.metrics.timings.merge(result['timings'])
+            self.metrics.add_bytes_read(result['bytes read'])
+            self.metrics.add_allocations(result['allocations'])
+            self.metrics.frame_done(result['frames'])
+            self.condition.notify_all()
+
+    def serve_worker(self, conn, address):
+        name = f"{address[0]}:{address[1]}"
+        idx = None
+        with self.condition:
+            self.connections.add(conn)
+        try:
+            conn.settimeout(WORKER_TIMEOUT)
+            hello = receive_message(conn)
+            if not self.authorized(hello):
+                self.logger.warning(f"Rejected worker {name}")
+                return
+            name = hello.get('name') or name
+            self.logger.debug(f"Worker {name} connected")
+
+            while True:
+                self.control.checkpoint()
+                idx = self.next_task()
+                if idx is None:
+                    send_message(conn, {'type': 'done'})
+                    return
+
+                send_message(conn, dict(self.tasks[idx], type='task', segment=idx))
+                message = receive_message(conn)
+                while message.get('type') == 'heartbeat':
+                    message = receive_message(conn)
+
+                if message.get('type') == 'error':
+                    self.task_failed(idx, name, message.get('message'))
+                elif message.get('type') == 'result' and message.get('segment') == idx:
+                    sizes = message['sizes']
+                    if len(sizes) != len(self.segment_filenames[idx]):
+                        raise ProtocolError(f"expected {len(self.segment_filenames[idx])} files, got {len(sizes)}")
+                    for filename, size in zip(self.segment_filenames[idx], sizes):
+                        receive_file(conn, filename, size)
+                    self.task_done(idx, message)
+                else:
+                    raise ProtocolError(f"unexpected message {message.get('type')}")
+                idx = None
+        except RenderCancelled:
+            pass
+        except (OSError, ProtocolError, KeyError, TypeError) as e:
+            if idx is not None:
+                self.task_failed(idx, name, f"lost connection ({e or type(e).__name__})")
+            else:
+                self.logger.debug(f"Worker {name} disconnected: {e}")
+        finally:
+            with self.condition:
+                self.connections.discard(conn)
+            conn.close()
+
+class Worker:
+    '''
+    Connects to a Coordinator, encodes the segments it's sent and returns
+    the files. Reconnects after each render, or whenever the coordinator
+    can't be reached, until stopped. input_folder replaces the
+    coordinator's input folder when the photos are mounted somewhere else
+    on this machine.
+    '''
+    def __init__(self, logger, address, token="", input_folder=None, retry_interval=2.0):
+        self.logger = logger
+        self.address = address
+        self.token = token
+        self.input_folder = input_folder
+        self.retry_interval = retry_interval
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+
+    def run(self, once=False):
+        while True:
+            try:
+                with socket.create_connection(self.address, timeout=self.retry_interval) as sock:
+                    sock.settimeout(None)
+                    self.serve(sock)
+                    if once:
+                        return
+            except (OSError, ProtocolError) as e:
+                self.logger.debug(f"Coordinator {self.address[0]}:{self.address[1]} not available: {e}")
+            time.sleep(self.retry_interval)
+
+    def serve(self, sock):
+        send_message(sock, {'type': 'hello', 'name': self.name, 'token': self.token})
+        while True:
+            message = receive_message(sock)
+            if message.get('type') == 'done':
+                return
+            if message.get('type') != 'task':
+                raise ProtocolError(f"unexpected message {message.get('type')}")
+
+            self.logger.info(f"Encoding segment {message['segment']}: {len(message['filenames'])} frames")
+            with tempfile.TemporaryDirectory() as segment_dir:
+                try:
+                    result, filenames = self.encode(message, segment_dir, sock)
+                except (OSError, ProtocolError):
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Segment {message['segment']} failed: {e}")
+                    send_message(sock, {'type': 'error', 'segment': message['segment'], 'message': str(e)})
+                    continue
+
+                send_message(sock, result)
+                for filename in filenames:
+                    with open(filename, 'rb') as f:
+                        sock.sendfile(f)
+
+    def encode(self, task, segment_dir, sock):
+        cfg = Config(task['cfg'])
+        folder = self.input_folder or task['folder']
+        cfg['input folder'] = folder
+        targets = [OutputTarget(dimensions, video_format, suffix) for dimensions, video_format, suffix in task['targets']]
+        filenames = [os.path.join(segment_dir, f"segment{target.suffix}.{target.extension}") for target in targets]
+
+        last_heartbeat = time.monotonic()
+        def heartbeat(count):
+            nonlocal last_heartbeat
+            now = time.monotonic()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                # Fails once the coordinator is gone, which stops the encode
+                send_message(sock, {'type': 'heartbeat', 'frames': count})
+                last_heartbeat = now
+
+        frames, timings, bytes_read, allocations = encode_segment(
+            [os.path.join(folder, name) for name in task['filenames']],
+            filenames, cfg, targets, task['skip head'], task['skip tail'],
+            on_frame=heartbeat)
+
+        return {'type': 'result',
+                'segment': task['segment'],
+                'frames': frames,
+                'timings': timings,
+                'bytes read': bytes_read,
+                'allocations': allocations,
+                'sizes': [os.path.getsize(filename) for filename in filenames]}, filenames
+
+def run_workers(logger, address, token="", input_folder=None, processes=1):
+    '''
+    Runs `processes` Workers, each in its own process so they encode in
+    parallel, until interrupted.
+    '''
+    if processes <= 1:
+        Worker(logger, address, token, input_folder).run()
+        return
+
+    import multiprocessing
+    workers = [multiprocessing.Process(target=run_worker_process, args=(address, token, input_folder), daemon=True)
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+def run_worker_process(address, token, input_folder):
+    import logging
+    try:
+        Worker(logging.getLogger(), address, token, input_folder).run()
+    except KeyboardInterrupt:
+        pass
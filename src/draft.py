@@ -0,0 +1,39 @@
+from .config import Config
+from .retime import stride_indices
+
+def get_draft_config(cfg):
+    '''
+    Copy of cfg for a quick low resolution proxy of the same render. Frame
+    selection, ordering, dedupe and deflicker are left alone so the draft
+    shows what the real render will produce.
+    '''
+    draft = Config(cfg.d)
+    draft['output file'] = f"{cfg['output file']}_draft"
+    draft['output width'] = cfg['draft width']
+    draft['output height'] = cfg['draft height']
+    # OpenCV's built-in MJPEG encoder is the fastest one that's always available
+    draft['output format'] = "avi(mjpeg)"
+    draft['encoder'] = "opencv"
+    draft['extra outputs'] = []
+    draft['incremental'] = False
+    draft['checkpoint'] = False
+    draft['distributed address'] = ""
+    draft['reduced decode'] = True
+    return draft
+
+def select_draft_frames(input_filenames, num_outputs, max_frames):
+    '''
+    Returns (input filenames, output frame count, fps scale). At most
+    max_frames evenly spaced frames of the final video are kept and the fps
+    is scaled down to match, so the draft runs as long as the real video.
+    Blending is replaced by striding. Interpolation is only kept while the
+    draft still has more frames than there are inputs.
+    '''
+    total = num_outputs or len(input_filenames)
+    count = min(total, max_frames) if max_frames > 0 else total
+
+    if count > len(input_filenames):
+        return input_filenames, count, count / total
+
+    indices = stride_indices(len(input_filenames), count)
+    return [input_filenames[idx] for idx in indices], None, count / total
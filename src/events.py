@@ -0,0 +1,176 @@
+from .timings import StageTimings
+
+from collections import deque
+import json
+import os
+import threading
+import time
+
+class RenderEvent:
+    '''
+    kind is one of:
+        'start'     total_frames, output
+        'progress'  frames_done, total_frames, percent, fps, eta, elapsed,
+                    bytes_read, bytes_written, stages
+        'slow_frame' filename, stage, seconds, typical
+        'finish'    succeeded, cancelled, frames_done, elapsed, fps,
+                    bytes_read, bytes_written, allocations, stages
+    '''
+    def __init__(self, kind, **data):
+        self.kind = kind
+        self.time = time.time()
+        self.data = data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def as_dict(self):
+        return dict(self.data, kind=self.kind, time=self.time)
+
+class RenderMetrics:
+    '''
+    Collects what happens during a render and publishes it as RenderEvents.
+
+    Stage timings and byte counts may be recorded from any thread. Events are
+    only delivered from the thread that calls frame_done/start/finish (the
+    writer), and progress events at most every `interval` seconds, so
+    subscribers never slow the render down.
+    '''
+    def __init__(self, interval=0.25, rolling_seconds=5.0, slow_frame_factor=4.0):
+        self.interval = interval
+        self.rolling_seconds = rolling_seconds
+        self.slow_frame_factor = slow_frame_factor
+        self.subscribers = []
+
+        self.timings = StageTimings()
+        self.lock = threading.Lock()
+        self.bytes_read = 0
+        self.allocations = 0  # frame-sized buffers the reader had to allocate
+        self.slow_frames = []
+        self.typical = {}  # stage -> moving average seconds per frame
+
+        self.started = None
+        self.output = None
+        self.total_frames = 0
+        self.frames_done = 0
+        self.samples = deque()
+        self.last_publish = 0.0
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def publish(self, event):
+        for callback in self.subscribers:
+            callback(event)
+
+    def start(self, total_frames, output=None):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        self.output = output
+        self.total_frames = total_frames
+        self.frames_done = 0
+        self.samples = deque([(now, 0)])
+        self.last_publish = now
+
+        self.publish(RenderEvent('start', total_frames=total_frames, output=output))
+
+    def add_stage(self, stage, seconds, filename=None):
+        self.timings.add(stage, seconds)
+        if filename is None:
+            return
+
+        with self.lock:
+            typical = self.typical.get(stage)
+            if typical is not None and seconds > typical * self.slow_frame_factor and seconds > 0.05:
+                self.slow_frames.append((filename, stage, seconds, typical))
+            self.typical[stage] = seconds if typical is None else typical * 0.95 + seconds * 0.05
+
+    def add_bytes_read(self, count):
+        with self.lock:
+            self.bytes_read += count
+
+    def add_allocations(self, count):
+        with self.lock:
+            self.allocations += count
+
+    def get_bytes_written(self):
+        try:
+            return os.path.getsize(self.output) if self.output else 0
+        except OSError:
+            return 0
+
+    def get_fps(self, now):
+        while len(self.samples) > 1 and now - self.samples[0][0] > self.rolling_seconds:
+            self.samples.popleft()
+
+        start_time, start_frames = self.samples[0]
+        if now <= start_time:
+            return 0.0
+        return (self.frames_done - start_frames) / (now - start_time)
+
+    def frame_done(self, count=1):
+        self.frames_done += count
+        now = time.perf_counter()
+        self.samples.append((now, self.frames_done))
+
+        if now - self.last_publish < self.interval and self.frames_done < self.total_frames:
+            return
+        self.last_publish = now
+
+        with self.lock:
+            slow_frames, self.slow_frames = self.slow_frames, []
+            bytes_read = self.bytes_read
+
+        for filename, stage, seconds, typical in slow_frames:
+            self.publish(RenderEvent('slow_frame', filename=filename, stage=stage,
+                                     seconds=seconds, typical=typical))
+
+        fps = self.get_fps(now)
+        remaining = self.total_frames - self.frames_done
+        self.publish(RenderEvent('progress',
+                                 frames_done=self.frames_done,
+                                 total_frames=self.total_frames,
+                                 percent=self.frames_done / self.total_frames * 100 if self.total_frames else 100.0,
+                                 fps=fps,
+                                 eta=remaining / fps if fps else None,
+                                 elapsed=now - self.started,
+                                 bytes_read=bytes_read,
+                                 bytes_written=self.get_bytes_written(),
+                                 stages=self.timings.as_dict()))
+
+    def finish(self, succeeded, cancelled=False):
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        self.publish(RenderEvent('finish',
+                                 succeeded=succeeded,
+                                 cancelled=cancelled,
+                                 frames_done=self.frames_done,
+                                 elapsed=elapsed,
+                                 fps=self.frames_done / elapsed if elapsed else 0.0,
+                                 bytes_read=self.bytes_read,
+                                 bytes_written=self.get_bytes_written(),
+                                 allocations=self.allocations,
+                                 stages=self.timings.as_dict()))
+
+class JsonReport:
+    '''
+    Subscriber that writes the run's progress samples, slow frames and
+    summary to a JSON file when the render finishes.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event.as_dict())
+        if event.kind != 'finish':
+            return
+
+        report = {
+            'summary': event.as_dict(),
+            'slow_frames': [e for e in self.events if e['kind'] == 'slow_frame'],
+            'progress': [e for e in self.events if e['kind'] == 'progress'],
+        }
+        with open(self.path, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,251 @@
+from .archive import is_archive, open_archive
+from .image_header import read_image_header
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+
+class IndexEntry:
+    __slots__ = ('path', 'name', 'type', 'size', 'mtime', 'width', 'height', 'captured')
+
+    def __init__(self, path, name, image_type, size, mtime, dimensions, captured=None):
+        self.path = path
+        self.name = name
+        self.type = image_type
+        self.size = size
+        self.mtime = mtime
+        self.width, self.height = dimensions if dimensions else (None, None)
+        self.captured = captured
+
+    @property
+    def dimensions(self):
+        if self.width is None:
+            return None
+        return self.width, self.height
+
+    @property
+    def capture_time(self):
+        '''
+        EXIF capture time, or the modification time for files without one.
+        '''
+        return self.captured if self.captured is not None else self.mtime
+
+    def as_list(self):
+        return [self.type, self.size, self.mtime, self.width, self.height, self.captured]
+
+    @classmethod
+    def from_list(cls, path, name, values):
+        image_type, size, mtime, width, height, captured = values
+        return cls(path, name, image_type, size, mtime, (width, height) if width is not None else None, captured)
+
+# Keys for FolderIndex.photos(sort_method); the name breaks ties
+SORT_METHODS = {
+    "name": lambda entry: entry.name,
+    "capture time": lambda entry: (entry.capture_time, entry.name),
+}
+
+class IndexCache:
+    '''
+    Header fields of every file in a folder, persisted between runs so an
+    unchanged folder is indexed without opening any file.
+    '''
+    cache_dir = os.path.join("cache", "index")
+    version = 1
+
+    def __init__(self, folder):
+        key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, folder):
+        try:
+            with open(self.path) as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        try:
+            if d.get('version') != self.version:
+                return {}
+            return {name: IndexEntry.from_list(os.path.join(folder, name), name, entry)
+                    for name, entry in d['entries'].items()}
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return {}
+
+    def save(self, entries):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(f"{self.path}.tmp", 'w') as f:
+                json.dump({'version': self.version,
+                           'entries': {name: entry.as_list() for name, entry in entries.items()}}, f)
+            os.replace(f"{self.path}.tmp", self.path)
+        except OSError:
+            # Only a cache, the index itself is still correct
+            pass
+
+class FolderIndex:
+    '''
+    Single-pass listing of a folder.
+
+    One os.scandir pass records every file's byte size and mtime. The image
+    type, dimensions and EXIF capture time are parsed from the file header,
+    and only for files that are new or whose size/mtime changed since the
+    last refresh. Headers are read by a thread pool and the results are
+    kept in an IndexCache, so they survive restarts.
+    '''
+    workers = 8
+
+    def __init__(self, folder, persist=True):
+        self.folder = folder
+        self.cache = IndexCache(folder) if persist else None
+        self.entries = self.cache.load(folder) if self.cache else {}
+        self.lock = threading.Lock()
+
+    def list_files(self):
+        '''
+        (name, byte size, mtime) of every file in the folder.
+        '''
+        files = []
+        try:
+            it = os.scandir(self.folder)
+        except OSError:
+            # A missing folder is empty, as it was for glob("*")
+            return files
+
+        with it:
+            for dir_entry in it:
+                # Same files glob("*") used to return
+                if dir_entry.name.startswith('.'):
+                    continue
+                try:
+                    if not dir_entry.is_file():
+                        continue
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                files.append((dir_entry.name, stat.st_size, stat.st_mtime))
+        return files
+
+    def stat_file(self, name):
+        '''
+        (byte size, mtime) of one file, or None if it doesn't exist.
+        '''
+        try:
+            stat = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def read_entry(self, name, size, mtime):
+        path = os.path.join(self.folder, name)
+        try:
+            image_type, dimensions, captured = read_image_header(path)
+        except OSError:
+            image_type, dimensions, captured = None, None, None
+
+        return IndexEntry(path, name, image_type, size, mtime, dimensions, captured)
+
+    def refresh(self):
+        entries = {}
+        changed = []
+
+        for name, size, mtime in self.list_files():
+            entry = self.entries.get(name)
+            if not entry or entry.size != size or entry.mtime != mtime:
+                changed.append((name, size, mtime))
+            else:
+                entries[name] = entry
+
+        if len(changed) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for entry in pool.map(lambda args: self.read_entry(*args), changed):
+                    entries[entry.name] = entry
+        else:
+            for args in changed:
+                entry = self.read_entry(*args)
+                entries[entry.name] = entry
+
+        # Unchanged entries are a subset of the old ones, so equal counts mean nothing was removed
+        modified = changed or len(entries) != len(self.entries)
+        self.entries = entries
+        if self.cache and modified:
+            self.cache.save(entries)
+        return self
+
+    def update(self, names):
+        '''
+        Re-reads only the named files, e.g. ones reported by a folder watcher.
+        Returns their entries, skipping files that no longer exist.
+        '''
+        entries = []
+        modified = False
+        for name in names:
+            stat = self.stat_file(name)
+            if stat is None:
+                self.entries.pop(name, None)
+                continue
+
+            size, mtime = stat
+            entry = self.entries.get(name)
+            if not entry or entry.size != size or entry.mtime != mtime:
+                entry = self.read_entry(name, size, mtime)
+                self.entries[name] = entry
+                modified = True
+            entries.append(entry)
+
+        if self.cache and modified:
+            self.cache.save(self.entries)
+        return entries
+
+    def files(self, sort_method="name"):
+        return sorted(self.entries.values(), key=SORT_METHODS[sort_method])
+
+    def photos(self, sort_method="name"):
+        return [entry for entry in self.files(sort_method) if entry.type]
+
+    def photo_paths(self):
+        return [entry.path for entry in self.photos()]
+
+    def get(self, path):
+        return self.entries.get(os.path.basename(path))
+
+class ArchiveIndex(FolderIndex):
+    '''
+    FolderIndex of the photos in a zip or uncompressed tar archive. Members
+    are listed from the archive's own index and their headers are read in
+    place, nothing is extracted. Entry paths are <archive>/<member name>,
+    which the frame readers open through archive.open_input.
+    '''
+    def list_files(self):
+        return open_archive(self.folder).members()
+
+    def stat_file(self, name):
+        archive = open_archive(self.folder)
+        return archive.stat(name) if name in archive.infos else None
+
+    def get(self, path):
+        return self.entries.get(os.path.relpath(path, self.folder).replace(os.sep, '/'))
+
+folder_indexes = {}
+folder_indexes_lock = threading.Lock()
+
+def get_folder_index(folder, refresh=True):
+    '''
+    Returns the shared FolderIndex for folder (an ArchiveIndex if it's a zip
+    or tar archive), so the GUI and the renderer
+    reuse each other's header reads. With refresh=False an index that has
+    already been scanned is returned as is.
+    '''
+    key = os.path.abspath(folder)
+    with folder_indexes_lock:
+        if key not in folder_indexes:
+            folder_indexes[key] = ArchiveIndex(folder) if is_archive(folder) else FolderIndex(folder)
+            refresh = True
+        index = folder_indexes[key]
+
+    if refresh:
+        with index.lock:
+            index.refresh()
+
+    return index
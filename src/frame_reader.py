@@ -0,0 +1,193 @@
+from .archive import get_input_size, open_input
+from .image_header import read_jpeg_header
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import io
+import numpy as np
+import struct
+import threading
+import time
+
+# Largest factor first; libjpeg scales the DCT so these skip most decode work
+REDUCED_COLOR_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+# Enough for the EXIF block and other markers that come before a JPEG's SOF
+JPEG_HEADER_BYTES = 256 * 1024
+
+def get_reduced_decode_flag(source_size, dimensions):
+    '''
+    Pick the most reduced imread mode whose output still covers dimensions.
+    '''
+    source_width, source_height = source_size
+    width, height = dimensions
+
+    for factor, flag in REDUCED_COLOR_FLAGS:
+        if source_width // factor >= width and source_height // factor >= height:
+            return flag
+
+    return cv2.IMREAD_COLOR
+
+def get_decode_flag(data, dimensions):
+    '''
+    Reduced decode flag for one encoded frame, from its own JPEG header, so
+    frames of different sizes in a folder are each reduced only as far as
+    they can be. Other formats are decoded in full; OpenCV would only
+    downscale them after a full decode.
+    '''
+    if bytes(data[:2]) != b'\xff\xd8':
+        return cv2.IMREAD_COLOR
+
+    try:
+        size, _ = read_jpeg_header(io.BytesIO(bytes(data[:JPEG_HEADER_BYTES])))
+    except (struct.error, ValueError):
+        size = None
+    if not size:
+        return cv2.IMREAD_COLOR
+    return get_reduced_decode_flag(size, dimensions)
+
+def imread(path, flag=cv2.IMREAD_COLOR):
+    '''
+    cv2.imread that also reads archive members.
+    '''
+    with open_input(path) as f:
+        data = f.read()
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+class FrameRing:
+    '''
+    Fixed set of output buffers for resized frames. Frame idx is resized
+    into buffer idx % size, so a buffer is written again only after `size`
+    newer frames, which is safe as long as no more than size - 1 frames are
+    alive downstream at once. Buffers are allocated on first use.
+    '''
+    def __init__(self, size, dimensions):
+        width, height = dimensions
+        self.shape = (height, width, 3)
+        self.buffers = [None] * max(1, size)
+        self.allocations = 0
+
+    def get(self, idx):
+        slot = idx % len(self.buffers)
+        buffer = self.buffers[slot]
+        if buffer is None:
+            buffer = self.buffers[slot] = np.empty(self.shape, dtype=np.uint8)
+            self.allocations += 1
+        return buffer
+
+class FrameReader:
+    '''
+    Decodes and resizes frames ahead of the video writer.
+
+    A pool of worker threads runs decode + resize while the writer encodes.
+    Results are handed back in input order and at most `depth` frames are in
+    flight at any time, so memory is capped regardless of the input count.
+
+    File bytes are read into a per-thread buffer and frames are resized into
+    a FrameRing, so in steady state the only per-frame allocation left is
+    the decoded image (cv2.imdecode can't decode into an existing array).
+    `retained` is how many yielded frames the consumer may still hold when
+    it asks for the next one.
+    '''
+    def __init__(self, filenames, dimensions, workers=1, depth=8, reduced_decode=False, metrics=None,
+                 retained=0):
+        self.filenames = filenames
+        self.dimensions = dimensions
+        self.reduced_decode = reduced_decode
+        self.workers = max(1, workers)
+        self.depth = max(1, depth)
+        self.metrics = metrics
+
+        in_flight = self.depth if self.workers > 1 else 1
+        self.ring = FrameRing(in_flight + retained + 1, dimensions)
+        self.local = threading.local()
+        self.read_buffer_allocations = 0
+
+    def read_bytes(self, filename):
+        with open_input(filename) as f:
+            size = get_input_size(f)
+
+            buffer = getattr(self.local, 'buffer', None)
+            if buffer is None or len(buffer) < size:
+                # Headroom so slightly bigger files don't reallocate every time
+                buffer = self.local.buffer = bytearray(size + size // 4)
+                self.read_buffer_allocations += 1
+
+            view = memoryview(buffer)
+            count = 0
+            while count < size:
+                read = f.readinto(view[count:size])
+                if not read:
+                    break
+                count += read
+
+        return np.frombuffer(buffer, dtype=np.uint8, count=count)
+
+    def read(self, filename, idx=0):
+        start = time.perf_counter()
+        data = self.read_bytes(filename)
+        flag = get_decode_flag(data, self.dimensions) if self.reduced_decode else cv2.IMREAD_COLOR
+        img = cv2.imdecode(data, flag)
+        if flag != cv2.IMREAD_COLOR and img is not None and \
+                (img.shape[1] < self.dimensions[0] or img.shape[0] < self.dimensions[1]):
+            # The header didn't match the image; never upscale a reduced decode
+            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if img is None:
+            raise IOError(f"Failed to read image: {filename}")
+        decoded = time.perf_counter()
+
+        if (img.shape[1], img.shape[0]) != tuple(self.dimensions):
+            img = cv2.resize(img, self.dimensions, dst=self.ring.get(idx))
+
+        if self.metrics:
+            self.metrics.add_stage('decode', decoded - start, filename)
+            self.metrics.add_stage('resize', time.perf_counter() - decoded)
+            self.metrics.add_bytes_read(len(data))
+        return img
+
+    def report_allocations(self):
+        if self.metrics:
+            self.metrics.add_allocations(self.ring.allocations + self.read_buffer_allocations)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        try:
+            yield from self.iter_frames()
+        finally:
+            self.report_allocations()
+
+    def iter_frames(self):
+        if self.workers == 1:
+            for idx, filename in enumerate(self.filenames):
+                yield self.read(filename, idx)
+            return
+
+        filenames = enumerate(self.filenames)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for idx, filename in filenames:
+                    pending.append(pool.submit(self.read, filename, idx))
+                    if len(pending) >= self.depth:
+                        break
+
+                while pending:
+                    img = pending.popleft().result()
+
+                    idx, filename = next(filenames, (None, None))
+                    if filename is not None:
+                        pending.append(pool.submit(self.read, filename, idx))
+
+                    yield img
+            finally:
+                for future in pending:
+                    future.cancel()
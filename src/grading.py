@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+# BT.601 luma weights in OpenCV's BGR channel order
+LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299])
+
+def contrast_curve(levels, contrast):
+    '''
+    Blends levels (0..1) towards a smoothstep S-curve for contrast > 0 and
+    away from it for contrast < 0. Monotonic for contrast in [-1, 1].
+    '''
+    s_curve = levels * levels * (3 - 2 * levels)
+    return levels + contrast * (s_curve - levels)
+
+def saturation_matrix(saturation):
+    '''
+    3x3 BGR matrix that moves each pixel away from (or towards) its own luma.
+    '''
+    return (saturation * np.eye(3) + (1 - saturation) * np.tile(LUMA_WEIGHTS, (3, 1))).astype(np.float32)
+
+class ColorGrade:
+    '''
+    White balance, gamma and a contrast curve compiled into one 256 entry
+    LUT per channel, applied with a single cv2.LUT. Saturation mixes the
+    channels, so it's a 3x3 matrix (one cv2.transform) after the LUT instead
+    of a 3D LUT; for this adjustment the two are equivalent. Frames are
+    graded in place.
+    '''
+    def __init__(self, gamma=1.0, white_balance=(1.0, 1.0, 1.0), contrast=0.0, saturation=1.0):
+        red, green, blue = white_balance
+        levels = np.arange(256, dtype=np.float64)[:, np.newaxis] / 255
+        curves = np.clip(levels * np.array([blue, green, red]), 0, 1) ** (1 / gamma)
+        if contrast:
+            curves = contrast_curve(curves, contrast)
+
+        self.lut = np.clip(curves * 255 + 0.5, 0, 255).astype(np.uint8).reshape(256, 1, 3)
+        self.matrix = None if saturation == 1 else saturation_matrix(saturation)
+
+    def apply(self, frame):
+        cv2.LUT(frame, self.lut, dst=frame)
+        if self.matrix is not None:
+            cv2.transform(frame, self.matrix, dst=frame)
+        return frame
+
+    def process(self, frames):
+        for frame in frames:
+            yield self.apply(frame)
+
+def get_grade_settings(cfg):
+    return {
+        'gamma': cfg['grade gamma'],
+        'white balance': list(cfg['grade white balance']),
+        'contrast': cfg['grade contrast'],
+        'saturation': cfg['grade saturation'],
+    }
+
+def is_neutral(cfg):
+    return get_grade_settings(cfg) == get_grade_settings(cfg.slots)
+
+def get_color_grade(cfg):
+    '''
+    The ColorGrade for cfg, or None if every adjustment is neutral.
+    '''
+    if is_neutral(cfg):
+        return None
+    return ColorGrade(cfg['grade gamma'],
+                      cfg['grade white balance'],
+                      cfg['grade contrast'],
+                      cfg['grade saturation'])
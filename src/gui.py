@@ -1,26 +1,58 @@
+from .archive import is_archive, open_input
 from .config_manager import ConfigManager
 from .config import Config
+from .events import RenderMetrics
+from .preview_grid import PreviewGrid
+from .render_control import RenderControl
+from .retime import get_target_frames
 from .time_lapse_creator import TimeLapseCreator
-from .utils import get_photos_in_folder
+from .folder_index import get_folder_index
 
-from PIL import Image, ImageTk, ImageOps
 import tkinter as tk
 import tkinter.font
-from tkinter import filedialog, messagebox, scrolledtext, ttk
-from ttkthemes import ThemedTk
+from tkinter import filedialog, messagebox, ttk
 import os
-import glob
+import queue
+import threading
+
+# PIL and ttkthemes (which loads PIL) are imported once the window is on
+# screen, see finish_startup(). cv2 loads when a render starts.
 
 FONT_SIZE = 14
+THEME = "plastik"
+RENDER_POLL_MS = 100
+
+ARCHIVE_FILETYPES = [
+    ("Photo archives", "*.zip *.tar"),
+    ("All files", "*")
+]
+
+LENGTH_MODES = [
+    "Use FPS",
+    "Fit (skip frames)",
+    "Fit (blend frames)"
+]
+
+# Dropdown label -> cfg['sort method']
+SORT_METHODS = {
+    "Name": "name",
+    "Capture Time": "capture time"
+}
 
 class GUI:
     def validate_fields(self):
         # Check input folder
         self.cfg['input folder'] = self.input_dir_entry['text'].strip()
-        if not os.path.exists(self.cfg['input folder']):
+        if not os.path.isdir(self.cfg['input folder']) and not is_archive(self.cfg['input folder']):
             messagebox.showerror("Error", f'Input folder does not exist: "{self.cfg["input folder"]}"')
             return False
-        elif not glob.glob(self.cfg['input folder'] + "/*"):
+
+        try:
+            files = get_folder_index(self.cfg['input folder']).files()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return False
+        if not files:
             messagebox.showerror("Error", f'Input folder is empty: "{self.cfg["input folder"]}"')
             return False
 
@@ -40,6 +72,17 @@ class GUI:
             messagebox.showerror("Error", f'FPS must be a positive number: "{self.cfg["fps"]}"')
             return False
 
+        # Check video length
+        if self.cfg['fit to length']:
+            try:
+                self.cfg['length'] = (float)(self.video_length_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", f'Video length must be a number: "{self.video_length_entry.get().strip()}"')
+                return False
+            if self.cfg['length'] <= 0:
+                messagebox.showerror("Error", f'Video length must be a positive number: "{self.cfg["length"]}"')
+                return False
+
         # Check video dimension
         try:
             self.cfg['output width'] = (int)(self.video_w_entry.get().strip())
@@ -61,7 +104,7 @@ class GUI:
 
         # Check HD / video format compatability
         if (self.cfg['output width'] > 4096 or self.cfg['output height'] > 4096) and\
-                self.cfg['output format'] != 'avi(raw)':
+                self.cfg['output format'] != 'avi(raw)' and self.cfg['encoder'] == 'opencv':
             messagebox.showerror("Error", f"Output format only supports up to 4K videos. Please switch to 'avi(raw)' format for higher resolution videos.")
             return False
 
@@ -79,26 +122,113 @@ class GUI:
 
         message = "Create with the following settings?\n\n"
 
-        num_photos = len(glob.glob(cfg['input folder'] + "/*"))
+        num_photos = len(get_folder_index(cfg['input folder'], refresh=False).photos())
         message += f"# Photos: {num_photos}\n"
 
-        # message += f"Video Length (sec): {cfg['length']}\n"
-
-        # fps = round(num_photos / cfg['length'], 2)
-        # message += f"FPS: {fps}\n"
-
-        message += f"Video Length (sec): {round(num_photos / self.cfg['fps'], 2)}\n"
+        if cfg['fit to length']:
+            message += f"Video Length (sec): {cfg['length']}\n"
+            message += f"# Frames: {get_target_frames(cfg)} ({self.selected_length_mode.get()})\n"
+        else:
+            message += f"Video Length (sec): {round(num_photos / self.cfg['fps'], 2)}\n"
         message += f"FPS: {self.cfg['fps']}\n"
 
         message += f"Resolution: {cfg['output width']} x {cfg['output height']}\n"
 
         message += f"Format: {cfg['output format']}"
 
+        for output in cfg['extra outputs']:
+            message += f"\nAlso: {output['width']} x {output['height']} {output.get('format', cfg['output format'])}"
+
         return message
 
-    def update_progress_bar(self, value):
-        self.progress_bar['value'] = value
-        self.root.update_idletasks()
+    def is_rendering(self):
+        return self.render_thread is not None and self.render_thread.is_alive()
+
+    def set_rendering(self, rendering):
+        self.button_run.state(['disabled' if rendering else '!disabled'])
+        self.button_draft.state(['disabled' if rendering else '!disabled'])
+        self.button_pause.state(['!disabled' if rendering else 'disabled'])
+        self.button_cancel.state(['!disabled' if rendering else 'disabled'])
+        self.button_pause.config(text="Pause")
+
+    def render_in_background(self, lapse):
+        try:
+            lapse.run()
+        except Exception as e:
+            # run() has already published 'finish', just keep the traceback
+            self.logger.exception(f"Render failed: {e}")
+
+    def poll_render(self):
+        '''
+        Drains the render's events on the Tk thread. Only the newest progress
+        event is drawn, so the render thread never waits on the UI.
+        '''
+        progress = finish = None
+        while True:
+            try:
+                event = self.render_events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event.kind == 'progress':
+                progress = event
+            elif event.kind == 'finish':
+                finish = event
+
+        if progress:
+            self.progress_bar['value'] = progress['percent']
+
+        if finish:
+            self.render_finished(finish)
+        else:
+            self.root.after(RENDER_POLL_MS, self.poll_render)
+
+    def render_finished(self, event):
+        self.render_thread.join()
+        self.render_thread = None
+        self.set_rendering(False)
+
+        if event['cancelled']:
+            self.logger.debug("Time lapse cancelled")
+            self.progress_bar['value'] = 0
+            messagebox.showinfo("Cancelled", "Time lapse cancelled.")
+            return
+
+        if not event['succeeded']:
+            messagebox.showinfo("Error", "Failed to create time lapse.")
+            return
+
+        if self.render_lapse.cfg['draft']:
+            self.logger.debug("Created draft")
+            os.startfile(self.render_lapse.output_filename)
+            return
+
+        self.logger.debug("Created time lapse")
+        messagebox.showinfo("Finished", "Time lapse created.")
+        os.startfile(self.cfg['output folder'])
+
+    def click_button_pause(self):
+        if self.render_control.is_paused():
+            self.logger.debug("Resume render")
+            self.render_control.resume()
+            self.button_pause.config(text="Pause")
+        else:
+            self.logger.debug("Pause render")
+            self.render_control.pause()
+            self.button_pause.config(text="Resume")
+
+    def click_button_cancel(self):
+        self.logger.debug("Cancel render")
+        self.render_control.cancel()
+        self.button_cancel.state(['disabled'])
+        self.button_pause.state(['disabled'])
+
+    def on_close(self):
+        if self.is_rendering():
+            # Stop at the next frame so the writer is released and the partial file removed
+            self.render_control.cancel()
+            self.render_thread.join()
+        self.root.destroy()
 
     def click_button_run(self):
         self.logger.debug("Click self.button_run")
@@ -116,16 +246,35 @@ class GUI:
             self.logger.debug("User chose not to create time lapse")
             return
 
-        lapse = TimeLapseCreator(self.logger, self.cfg, self.update_progress_bar)
-        succeeded = lapse.run()
+        # The render gets its own copy so editing the form can't change it mid-run
+        self.start_render(Config(self.cfg.d))
 
-        if not succeeded:
-            messagebox.showinfo("Error", "Failed to create time lapse.")
+    def click_button_draft(self):
+        self.logger.debug("Click self.button_draft")
+
+        if not self.validate_fields():
             return
 
-        self.logger.debug("Created time lapse")
-        messagebox.showinfo("Finished", "Time lapse created.")
-        os.startfile(self.cfg['output folder'])
+        cfg = Config(self.cfg.d)
+        cfg['draft'] = True
+        self.start_render(cfg)
+
+    def start_render(self, cfg):
+        self.render_events = queue.Queue()
+        self.render_control = RenderControl()
+        metrics = RenderMetrics()
+        metrics.subscribe(self.render_events.put)
+
+        # The folder was just scanned by validate_fields, render exactly what was shown
+        self.render_lapse = TimeLapseCreator(self.logger, cfg, metrics,
+                                             refresh_index=False, control=self.render_control)
+
+        self.progress_bar['value'] = 0
+        self.set_rendering(True)
+        self.render_thread = threading.Thread(target=self.render_in_background, args=(self.render_lapse,),
+                                              daemon=True)
+        self.render_thread.start()
+        self.root.after(RENDER_POLL_MS, self.poll_render)
 
     def clicked_input_dir_button(self):
         self.logger.debug("Click self.input_dir_button")
@@ -137,11 +286,35 @@ class GUI:
         
         self.logger.debug("Selected input folder: \"{folder}\"")
         if folder:
+            self.set_input_folder(folder)
+
+    def clicked_input_archive_button(self):
+        self.logger.debug("Click self.input_archive_button")
+
+        if self.cfg['input folder']:
+            archive = filedialog.askopenfilename(initialdir=os.path.dirname(self.cfg['input folder']),
+                                                 filetypes=ARCHIVE_FILETYPES)
+        else:
+            archive = filedialog.askopenfilename(filetypes=ARCHIVE_FILETYPES)
+
+        self.logger.debug(f"Selected input archive: \"{archive}\"")
+        if archive:
+            if not is_archive(archive):
+                messagebox.showerror("Error", f'Not a zip or tar archive: "{archive}"')
+                return
+            self.set_input_folder(archive)
+
+    def set_input_folder(self, folder):
+        try:
             self.update_num_photo_counter(folder)
-            self.input_dir_entry.config(text=folder)
-            self.cfg['input folder'] = folder
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        self.input_dir_entry.config(text=folder)
+        self.cfg['input folder'] = folder
 
-            self.logger.debug(f"Set input folder={folder}")
+        self.logger.debug(f"Set input folder={folder}")
 
     def clicked_output_dir_button(self):
         self.logger.debug("Click self.output_dir_button")
@@ -169,7 +342,7 @@ class GUI:
 
     def update_num_photo_counter(self, folder=None):
         if folder:
-            photos = get_photos_in_folder(folder)
+            photos = get_folder_index(folder).photos()
             num_photos = len(photos)
             self.num_photos_counter_label.config(
                 text=f"{num_photos} images"
@@ -182,44 +355,34 @@ class GUI:
             )
 
     def update_photo_preview(self, folder=None):
-        if self.photo_preview_container:
-            self.photo_preview_container.pack_forget()
-            self.photo_preview_container.destroy()
-
-        self.photo_preview_container = tk.scrolledtext.ScrolledText(
-            self.frame_photo_preview_container,
-            width=52
-        )
-        self.photo_preview_container.pack(side='top', fill='both')
-        self.photo_preview_container.images = []
-        self.photo_preview_container.configure(state="disabled")
+        if not folder:
+            self.photo_preview.set_photos([], None)
+            return
 
-        if folder:
-            photo_paths = get_photos_in_folder(folder)
+        # Same order the render will use
+        photos = get_folder_index(folder, refresh=False).photos(self.cfg['sort method'])
 
-            if not photo_paths:
-                return
+        self.photo_preview.set_photos([entry.path for entry in photos], self.get_thumbnail_cache(folder))
 
-            if self.selected_sort_method.get() == "Creation Time":
-                photo_paths = sorted(photo_paths, key=os.path.getctime)
+        if photos and self.cfg['use_loaded_photo_size']:
+            if photos[0].dimensions:
+                video_width, video_height = photos[0].dimensions
             else:
-                photo_paths = sorted(photo_paths)
-
-            for idx, image_file_path in enumerate(photo_paths):
-                img = Image.open(image_file_path)
-
-                if idx == 0:
+                from PIL import Image
+                with open_input(photos[0].path, buffering=-1) as f, Image.open(f) as img:
                     video_width, video_height = img.size
+            self.update_video_resolution(video_width, video_height)
 
-                img = ImageOps.fit(img, (128, 128), method = Image.ANTIALIAS,
-                   bleed = 0.0, centering =(0.5, 0.5))
-                img = ImageTk.PhotoImage(img)
+    def get_thumbnail_cache(self, folder):
+        if self.thumbnail_cache and self.thumbnail_cache.folder == os.path.abspath(folder):
+            return self.thumbnail_cache
 
-                self.photo_preview_container.image_create(tk.END, padx=5, pady=5, image=img)
-                self.photo_preview_container.images.append(img)  # Keep a reference.
+        if self.thumbnail_cache:
+            self.thumbnail_cache.close()
 
-            if self.cfg['use_loaded_photo_size']:
-                self.update_video_resolution(video_width, video_height)
+        from .thumbnail_cache import ThumbnailCache
+        self.thumbnail_cache = ThumbnailCache(folder)
+        return self.thumbnail_cache
 
     def update_video_resolution(self, width, height):
         self.video_w_entry.delete(0, 'end')
@@ -260,7 +423,14 @@ class GUI:
             text="Browse",
             command=self.clicked_input_dir_button
         )
-        self.input_dir_button.pack()
+        self.input_dir_button.pack(side='left')
+        # Zip or tar of photos, read in place
+        self.input_archive_button = ttk.Button(
+            frame_input_dir_button,
+            text="Archive",
+            command=self.clicked_input_archive_button
+        )
+        self.input_archive_button.pack(side='left')
 
         ## Output folder
         frame_output_dir_label = ttk.Frame(container)
@@ -317,6 +487,7 @@ class GUI:
     def init_time_lapse_options(self, container):
         ROWS = [
             'length',
+            'length mode',
             'fps',
             'width',
             'height',
@@ -339,13 +510,40 @@ class GUI:
         video_length_label.pack()
 
         frame_video_length_entry = ttk.Frame(container)
-        frame_video_length_entry.grid(row=ROWS.index('length'), column=1)
+        frame_video_length_entry.grid(row=ROWS.index('length'), column=1, stick="w")
         self.video_length_entry = ttk.Entry(
             frame_video_length_entry,
             width=5,
             validate='key',
             validatecommand = (vcmd_is_float, '%P')
         )
+        self.video_length_entry.insert(0, self.cfg['length'])
+        self.video_length_entry.pack()
+
+        # Length mode
+        self.selected_length_mode = tk.StringVar()
+        if not self.cfg['fit to length']:
+            self.selected_length_mode.set(LENGTH_MODES[0])
+        elif self.cfg['length blend']:
+            self.selected_length_mode.set(LENGTH_MODES[2])
+        else:
+            self.selected_length_mode.set(LENGTH_MODES[1])
+
+        frame_length_mode_label = ttk.Frame(container)
+        frame_length_mode_label.grid(row=ROWS.index('length mode'), column=0, sticky='w')
+        length_mode_label = ttk.Label(frame_length_mode_label, text="Length Mode:")
+        length_mode_label.pack()
+
+        frame_length_mode_dropdown = ttk.Frame(container)
+        frame_length_mode_dropdown.grid(row=ROWS.index('length mode'), column=1, sticky='w')
+        self.length_mode = ttk.OptionMenu(
+            frame_length_mode_dropdown,
+            self.selected_length_mode,
+            self.selected_length_mode.get(),
+            *LENGTH_MODES,
+            command=self.length_mode_changed
+        )
+        self.length_mode.pack()
 
         # FPS
         frame_video_fps_label = ttk.Frame(container)
@@ -452,7 +650,8 @@ class GUI:
         self.frame_photo_preview_container = tk.Frame(container)
         self.frame_photo_preview_container.grid(row=0, column=0)
 
-        self.photo_preview_container = None
+        self.photo_preview = PreviewGrid(self.frame_photo_preview_container)
+        self.photo_preview.pack(side='top', fill='both')
 
         # Num photos counter
         frame_num_photos_counter_label = ttk.Frame(container)
@@ -467,11 +666,6 @@ class GUI:
         self.num_photos_counter_label.pack(fill='x', expand='yes')
 
         # Sort method
-        SORT_METHODS = [
-            "Name",
-            "Creation Time"
-        ]
-
         frame_sort_method_dropdown = ttk.Frame(container)
         frame_sort_method_dropdown.grid(row=2, column=0, sticky='w')
         self.sort_method_dropdown = ttk.OptionMenu(
@@ -490,19 +684,27 @@ class GUI:
         label_sort_method_dropdown.pack(side='left')
 
     def sort_method_changed(self, choice):
+        self.logger.debug(f"Sort method changed to={choice}")
+        self.cfg['sort method'] = SORT_METHODS[choice]
         if 'input folder' in self.cfg:
             self.update_photo_preview(self.cfg['input folder'])
 
+    def length_mode_changed(self, choice):
+        self.logger.debug(f"Length mode changed to={choice}")
+        self.cfg['fit to length'] = choice != LENGTH_MODES[0]
+        self.cfg['length blend'] = choice == LENGTH_MODES[2]
+
     def video_format_type_changed(self, choice):
         self.logger.debug(f"Video format type changed to={choice}")
         self.cfg["output format"] = choice
 
     def init_grid(self):
-        self.root = ThemedTk(theme="plastik")
+        self.root = tk.Tk()
         self.root.title("Time Lapse Creator")
 
         self.selected_sort_method = tk.StringVar()
-        self.selected_sort_method.set("Name")
+        self.selected_sort_method.set(next(label for label, method in SORT_METHODS.items()
+                                           if method == self.cfg['sort method']))
 
         tk.font.nametofont("TkDefaultFont").configure(size=FONT_SIZE)
         tk.font.nametofont("TkTextFont").configure(size=FONT_SIZE)
@@ -549,6 +751,41 @@ class GUI:
         )
         self.button_run.pack(expand='yes', fill='y')
 
+        # Quick low resolution proxy to check timing and order
+        self.button_draft = ttk.Button(
+            left_root_frame,
+            text="Preview Draft",
+            command=self.click_button_draft
+        )
+        self.button_draft.pack(expand='yes', fill='y')
+
+        # Pause / Cancel, only enabled while rendering
+        frame_render_controls = ttk.Frame(left_root_frame)
+        frame_render_controls.pack()
+        self.button_pause = ttk.Button(
+            frame_render_controls,
+            text="Pause",
+            command=self.click_button_pause
+        )
+        self.button_pause.pack(side='left')
+        self.button_cancel = ttk.Button(
+            frame_render_controls,
+            text="Cancel",
+            command=self.click_button_cancel
+        )
+        self.button_cancel.pack(side='left')
+        self.set_rendering(False)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def finish_startup(self):
+        '''
+        Applies the theme and loads the saved input folder's preview. Both
+        import PIL, so they wait until the window has been drawn.
+        '''
+        from ttkthemes import ThemedStyle
+        ThemedStyle(self.root, theme=THEME)
+
         if 'input folder' in self.cfg:
             self.update_num_photo_counter(self.cfg['input folder'])
 
@@ -556,5 +793,9 @@ class GUI:
         self.logger = logger
         self.cfg_manager = ConfigManager(self.logger)
         self.cfg = self.cfg_manager.load()
+        self.thumbnail_cache = None
+        self.render_thread = None
         self.init_grid()
+        self.root.update()
+        self.finish_startup()
         self.root.mainloop()
\ No newline at end of file
@@ -0,0 +1,211 @@
+from .archive import open_input
+
+from datetime import datetime
+import imghdr
+import struct
+import time
+
+# Enough for imghdr and for the fixed-offset size fields of PNG/GIF/BMP/WEBP
+HEADER_BYTES = 32
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_DATETIME_TAG = 0x0132
+EXIF_IFD_POINTER_TAG = 0x8769
+EXIF_DATETIME_ORIGINAL_TAG = 0x9003
+EXIF_SUBSEC_TIME_ORIGINAL_TAG = 0x9291
+
+EXIF_TYPE_ASCII = 2
+EXIF_TYPE_SHORT = 3
+EXIF_TYPE_LONG = 4
+
+def read_exif_tags(tiff, tags, ifd_offset=None):
+    '''
+    Looks up `tags` in one IFD of a TIFF-structured EXIF block, IFD0 unless
+    ifd_offset is given.
+    Returns {tag: (type, count, value_offset_bytes)} for the tags found.
+    '''
+    if len(tiff) < 8:
+        return {}
+
+    endian = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if not endian:
+        return {}
+
+    if ifd_offset is None:
+        ifd_offset, = struct.unpack(endian + 'I', tiff[4:8])
+    if ifd_offset + 2 > len(tiff):
+        return {}
+
+    num_entries, = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])
+    found = {}
+    for idx in range(num_entries):
+        pos = ifd_offset + 2 + idx * 12
+        if pos + 12 > len(tiff):
+            break
+        tag, value_type, count = struct.unpack(endian + 'HHI', tiff[pos:pos + 8])
+        if tag in tags:
+            found[tag] = (value_type, count, tiff[pos + 8:pos + 12])
+
+    return found
+
+def read_exif_value(tiff, tag_entry):
+    '''
+    Decodes an ASCII, SHORT or LONG tag found by read_exif_tags. Returns None
+    for other types.
+    '''
+    endian = '<' if tiff[:2] == b'II' else '>'
+    value_type, count, value = tag_entry
+
+    if value_type == EXIF_TYPE_SHORT:
+        return struct.unpack(endian + 'H', value[:2])[0]
+    if value_type == EXIF_TYPE_LONG:
+        return struct.unpack(endian + 'I', value)[0]
+    if value_type == EXIF_TYPE_ASCII:
+        if count > 4:
+            offset, = struct.unpack(endian + 'I', value)
+            value = tiff[offset:offset + count]
+        return value[:count].split(b'\x00')[0].decode('ascii', errors='replace')
+
+    return None
+
+def read_exif_orientation(tiff):
+    tags = read_exif_tags(tiff, {EXIF_ORIENTATION_TAG})
+    if EXIF_ORIENTATION_TAG not in tags:
+        return 1
+
+    return read_exif_value(tiff, tags[EXIF_ORIENTATION_TAG])
+
+def parse_exif_datetime(text, subsec=None):
+    '''
+    "YYYY:MM:DD HH:MM:SS" plus optional subsecond digits as seconds since
+    the epoch. EXIF times are the camera's wall clock with no time zone, so
+    they are read as local time, matching the modification times that
+    photos without EXIF are sorted by.
+    '''
+    try:
+        captured = datetime.strptime(text.strip(), "%Y:%m:%d %H:%M:%S")
+        seconds = time.mktime(captured.timetuple())
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+    if isinstance(subsec, str) and subsec.strip().isdigit():
+        seconds += float(f"0.{subsec.strip()}")
+    return seconds
+
+def read_exif_capture_time(tiff):
+    '''
+    DateTimeOriginal (+ SubSecTimeOriginal) from the Exif IFD, falling back
+    to IFD0's DateTime. None if neither is present.
+    '''
+    ifd0 = read_exif_tags(tiff, {EXIF_DATETIME_TAG, EXIF_IFD_POINTER_TAG})
+
+    if EXIF_IFD_POINTER_TAG in ifd0:
+        exif_offset = read_exif_value(tiff, ifd0[EXIF_IFD_POINTER_TAG])
+        exif = read_exif_tags(tiff, {EXIF_DATETIME_ORIGINAL_TAG, EXIF_SUBSEC_TIME_ORIGINAL_TAG}, exif_offset)
+        if EXIF_DATETIME_ORIGINAL_TAG in exif:
+            subsec = exif.get(EXIF_SUBSEC_TIME_ORIGINAL_TAG)
+            captured = parse_exif_datetime(read_exif_value(tiff, exif[EXIF_DATETIME_ORIGINAL_TAG]),
+                                           read_exif_value(tiff, subsec) if subsec else None)
+            if captured is not None:
+                return captured
+
+    if EXIF_DATETIME_TAG in ifd0:
+        return parse_exif_datetime(read_exif_value(tiff, ifd0[EXIF_DATETIME_TAG]))
+
+    return None
+
+def read_jpeg_header(f):
+    '''
+    Walks the JPEG markers up to the first SOF segment and returns
+    ((width, height), capture time). Only segment headers and the EXIF block
+    are read, never the entropy-coded data.
+    '''
+    f.seek(2)
+    orientation = 1
+    captured = None
+
+    while True:
+        marker = f.read(2)
+        while len(marker) == 2 and marker[1] == 0xFF:
+            # Fill bytes between markers
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None, captured
+
+        code = marker[1]
+        if code == 0xD9 or code == 0xDA:
+            return None, captured
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None, captured
+        length, = struct.unpack('>H', length_bytes)
+
+        if code in JPEG_SOF_MARKERS:
+            sof = f.read(5)
+            if len(sof) < 5:
+                return None, captured
+            height, width = struct.unpack('>HH', sof[1:5])
+            # cv2.imread and PIL's exif_transpose rotate these orientations
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+            return (width, height), captured
+
+        if code == 0xE1:
+            segment = f.read(length - 2)
+            if segment[:6] == b'Exif\x00\x00':
+                orientation = read_exif_orientation(segment[6:])
+                captured = read_exif_capture_time(segment[6:])
+        else:
+            f.seek(length - 2, 1)
+
+def read_header_size(image_type, header):
+    if image_type == 'png' and len(header) >= 24:
+        return struct.unpack('>II', header[16:24])
+    if image_type == 'gif' and len(header) >= 10:
+        return struct.unpack('<HH', header[6:10])
+    if image_type == 'bmp' and len(header) >= 26:
+        width, height = struct.unpack('<ii', header[18:26])
+        return width, abs(height)
+    if image_type == 'webp' and len(header) >= 30:
+        chunk = header[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits, = struct.unpack('<I', header[21:25])
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            width = int.from_bytes(header[24:27], 'little') + 1
+            height = int.from_bytes(header[27:30], 'little') + 1
+            return width, height
+
+    return None
+
+def read_image_header(path):
+    '''
+    Returns (image type, (width, height), capture time) using only the file
+    header. The type is None for non-images, the size is None if it can't be
+    determined without decoding and the capture time is None unless the file
+    has EXIF date tags.
+    '''
+    with open_input(path, buffering=-1) as f:
+        header = f.read(HEADER_BYTES)
+        image_type = imghdr.what(None, header)
+        if not image_type:
+            return None, None, None
+
+        size = captured = None
+        try:
+            if image_type == 'jpeg':
+                size, captured = read_jpeg_header(f)
+            else:
+                size = read_header_size(image_type, header)
+        except (struct.error, ValueError, OSError):
+            pass
+
+    return image_type, size, captured
@@ -0,0 +1,58 @@
+import json
+import os
+
+class Manifest:
+    '''
+    Sidecar file stored next to a rendered video, listing the frames already
+    encoded into it (name, byte size, mtime) and the encoder settings used.
+    '''
+    version = 1
+
+    def __init__(self, settings, frames):
+        self.settings = settings
+        self.frames = frames
+
+    @staticmethod
+    def path_for(output_filename):
+        return f"{output_filename}.json"
+
+    @classmethod
+    def from_entries(cls, settings, entries):
+        return cls(settings, [[entry.name, entry.size, entry.mtime] for entry in entries])
+
+    @classmethod
+    def load(cls, output_filename):
+        try:
+            with open(cls.path_for(output_filename)) as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if d.get('version') != cls.version:
+            return None
+
+        return cls(d['settings'], d['frames'])
+
+    def save(self, output_filename):
+        path = self.path_for(output_filename)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump({'version': self.version, 'settings': self.settings, 'frames': self.frames}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def count_encoded(self, settings, entries):
+        '''
+        Returns how many of entries are already in the video: the manifest's
+        frames must be an unchanged prefix of entries and the settings must
+        match, otherwise nothing can be reused.
+        '''
+        if settings != self.settings or len(self.frames) > len(entries):
+            return 0
+
+        for frame, entry in zip(self.frames, entries):
+            if frame != [entry.name, entry.size, entry.mtime]:
+                return 0
+
+        return len(self.frames)
+
+    def append(self, entries):
+        self.frames.extend([entry.name, entry.size, entry.mtime] for entry in entries)
@@ -0,0 +1,50 @@
+from .utils import video_format_to_extension
+
+class OutputTarget:
+    '''
+    One video written by a render. The primary output has no suffix; extra
+    outputs get one so they can sit next to it in the output folder.
+    '''
+    def __init__(self, dimensions, video_format, suffix=""):
+        self.dimensions = tuple(dimensions)
+        self.video_format = video_format
+        self.extension = video_format_to_extension(video_format)
+        self.suffix = suffix
+
+    def get_filename(self, folder, name):
+        return f"{folder}/{name}{self.suffix}.{self.extension}"
+
+def fit_dimensions(source_size, max_width, max_height):
+    '''
+    Scales source_size down, keeping its aspect ratio, until it fits in
+    max_width x max_height. Smaller sources are left as they are.
+    '''
+    width, height = source_size
+
+    x_factor = width / max_width
+    y_factor = height / max_height
+
+    if x_factor >= y_factor and x_factor > 1.0:
+        height = round(height / x_factor)
+        width  = round(width  / x_factor)
+    elif y_factor >= x_factor and y_factor > 1.0:
+        height = round(height / y_factor)
+        width  = round(width  / y_factor)
+
+    return (width, height)
+
+def get_output_targets(cfg, source_size):
+    '''
+    The primary output plus cfg['extra outputs'], largest first so that each
+    resolution can be resized from the one before it.
+    '''
+    targets = [OutputTarget(fit_dimensions(source_size, cfg['output width'], cfg['output height']),
+                            cfg['output format'])]
+
+    for output in cfg['extra outputs']:
+        dimensions = fit_dimensions(source_size, output['width'], output['height'])
+        suffix = output.get('name') or f"_{dimensions[0]}x{dimensions[1]}"
+        targets.append(OutputTarget(dimensions, output.get('format', cfg['output format']), suffix))
+
+    # sorted() is stable, so the primary output stays ahead of extras of the same size
+    return sorted(targets, key=lambda target: target.dimensions[0] * target.dimensions[1], reverse=True)
@@ -0,0 +1,62 @@
+from .retime import group_sizes
+
+from itertools import islice
+
+def get_context_frames(cfg):
+    '''
+    Number of neighbouring frames a stage needs to see on each side of a
+    frame. Segments are decoded with this much overlap so stateful stages
+    give the same result as a single pass.
+    '''
+    if cfg['deflicker']:
+        return cfg['deflicker window'] // 2
+    return 0
+
+def build_pipeline(filenames, dimensions, cfg, skip_head=0, skip_tail=0, num_outputs=None,
+                   metrics=None):
+    '''
+    Returns an iterator over the processed frames for filenames, minus the
+    first skip_head and last skip_tail, which are only decoded as context.
+    If num_outputs is given, the frames are blended or interpolated to that
+    many.
+    '''
+    # The stages load cv2 and numpy, which only a render needs
+    from .deflicker import Deflicker
+    from .frame_reader import FrameReader
+    from .grading import get_color_grade
+    from .retime import blend_frames, interpolate_frames
+
+    num_inputs = len(filenames) - skip_head - skip_tail
+
+    # Frames the later stages hold on to while asking for the next one
+    retained = 0
+    if cfg['deflicker']:
+        deflicker = Deflicker(cfg['deflicker window'])
+        retained += deflicker.get_held_frames(skip_tail)
+    if num_outputs and num_outputs > num_inputs:
+        retained += 2
+
+    frames = FrameReader(filenames,
+                         dimensions,
+                         workers=cfg['decode workers'],
+                         depth=cfg['prefetch depth'],
+                         reduced_decode=cfg['reduced decode'],
+                         metrics=metrics,
+                         retained=retained)
+
+    if cfg['deflicker']:
+        frames = deflicker.process(frames, skip_head, skip_tail)
+    elif skip_head or skip_tail:
+        frames = islice(frames, skip_head, len(filenames) - skip_tail)
+
+    # Graded before retiming, which may hold on to a frame it has yielded
+    grade = get_color_grade(cfg)
+    if grade:
+        frames = grade.process(frames)
+
+    if num_outputs and num_outputs < num_inputs:
+        frames = blend_frames(frames, group_sizes(num_inputs, num_outputs))
+    elif num_outputs and num_outputs > num_inputs:
+        frames = interpolate_frames(frames, num_inputs, num_outputs)
+
+    return iter(frames)
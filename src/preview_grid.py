@@ -0,0 +1,165 @@
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+class PreviewGrid:
+    '''
+    Scrollable grid of photo thumbnails.
+
+    Thumbnails are produced on a background thread and handed to the Tk main
+    loop in small batches. Only the rows on screen, plus a margin of
+    MARGIN_ROWS above and below, hold live PhotoImages; everything else is
+    dropped and reloaded (from the thumbnail cache) when scrolled back into
+    view, so memory does not grow with the folder size.
+    '''
+    THUMBNAIL_SIZE = 128
+    PADDING = 5
+    COLUMNS = 3
+    VISIBLE_ROWS = 4
+    MARGIN_ROWS = 2
+    BATCH_SIZE = 12
+    POLL_MS = 30
+
+    def __init__(self, parent):
+        self.cell_size = self.THUMBNAIL_SIZE + 2 * self.PADDING
+
+        self.frame = tk.Frame(parent)
+        self.canvas = tk.Canvas(
+            self.frame,
+            width=self.COLUMNS * self.cell_size,
+            height=self.VISIBLE_ROWS * self.cell_size,
+            yscrollincrement=self.cell_size // 4,
+            highlightthickness=0
+        )
+        self.scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self.yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+
+        self.scrollbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand='yes')
+
+        self.canvas.bind("<Configure>", lambda event: self.refresh())
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll(1))
+
+        self.paths = []
+        self.thumbnail_cache = None
+        self.generation = 0
+        self.wanted = frozenset()
+        self.pending = set()
+        self.images = {}  # idx -> (canvas item, PhotoImage)
+
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+
+        self.worker = threading.Thread(target=self.load_thumbnails, daemon=True)
+        self.worker.start()
+
+        self.canvas.after(self.POLL_MS, self.poll_results)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_photos(self, paths, thumbnail_cache):
+        self.generation += 1
+        self.paths = list(paths)
+        self.thumbnail_cache = thumbnail_cache
+        self.wanted = frozenset()
+        self.pending.clear()
+
+        self.canvas.delete('all')
+        self.images.clear()
+
+        num_rows = (len(self.paths) + self.COLUMNS - 1) // self.COLUMNS
+        self.canvas.configure(scrollregion=(0, 0, self.COLUMNS * self.cell_size, num_rows * self.cell_size))
+        self.canvas.yview_moveto(0)
+
+        self.refresh()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def scroll(self, units):
+        self.canvas.yview_scroll(units, 'units')
+        self.refresh()
+
+    def on_mouse_wheel(self, event):
+        self.scroll(-1 if event.delta > 0 else 1)
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height() or int(self.canvas['height']))
+
+        first_row = max(0, int(top // self.cell_size) - self.MARGIN_ROWS)
+        last_row = int(bottom // self.cell_size) + self.MARGIN_ROWS
+
+        return range(first_row * self.COLUMNS,
+                     min(len(self.paths), (last_row + 1) * self.COLUMNS))
+
+    def refresh(self):
+        if not self.paths:
+            return
+
+        visible = self.visible_range()
+        self.wanted = frozenset(visible)
+        self.pending &= self.wanted
+
+        for idx in [idx for idx in self.images if idx not in self.wanted]:
+            item, _ = self.images.pop(idx)
+            self.canvas.delete(item)
+
+        missing = [idx for idx in visible if idx not in self.images and idx not in self.pending]
+        if missing:
+            self.pending.update(missing)
+            self.requests.put((self.generation, missing))
+
+    def load_thumbnails(self):
+        # Runs on the worker thread; must never touch Tk.
+        while True:
+            generation, indexes = self.requests.get()
+
+            for idx in indexes:
+                if generation != self.generation or idx not in self.wanted:
+                    continue
+
+                try:
+                    thumbnail, _ = self.thumbnail_cache.get(self.paths[idx])
+                except Exception:
+                    thumbnail = None
+
+                self.results.put((generation, idx, thumbnail))
+
+            if self.requests.empty() and self.thumbnail_cache:
+                try:
+                    self.thumbnail_cache.flush()
+                except Exception:
+                    pass
+
+    def poll_results(self):
+        for _ in range(self.BATCH_SIZE):
+            try:
+                generation, idx, thumbnail = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if generation != self.generation:
+                continue
+            self.pending.discard(idx)
+            if thumbnail is None or idx not in self.wanted or idx in self.images:
+                continue
+
+            # Already loaded by the thumbnail cache that produced `thumbnail`
+            from PIL import ImageTk
+            row, column = divmod(idx, self.COLUMNS)
+            image = ImageTk.PhotoImage(thumbnail)
+            item = self.canvas.create_image(
+                column * self.cell_size + self.PADDING,
+                row * self.cell_size + self.PADDING,
+                image=image,
+                anchor='nw'
+            )
+            self.images[idx] = (item, image)
+
+        self.canvas.after(self.POLL_MS, self.poll_results)
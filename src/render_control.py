@@ -0,0 +1,42 @@
+import multiprocessing
+
+class RenderCancelled(Exception):
+    pass
+
+class RenderControl:
+    '''
+    Lets another thread pause, resume or cancel a render. The render calls
+    checkpoint() between frames, so it always stops at a frame boundary.
+
+    Backed by multiprocessing events so the same control can be handed to
+    segment worker processes.
+    '''
+    def __init__(self):
+        self.cancelled = multiprocessing.Event()
+        self.running = multiprocessing.Event()
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        # Wake a paused render so it can notice
+        self.running.set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def checkpoint(self):
+        '''
+        Blocks while paused and raises RenderCancelled once cancelled.
+        '''
+        self.running.wait()
+        if self.cancelled.is_set():
+            raise RenderCancelled()
@@ -0,0 +1,76 @@
+# cv2 and numpy are imported by the frame stages below rather than here, so
+# the GUI and CLI can use the frame count helpers without loading them
+
+def get_target_frames(cfg):
+    return max(1, round(cfg['length'] * cfg['fps']))
+
+def stride_indices(num_inputs, num_outputs):
+    '''
+    Evenly spaced input indices to keep when dropping frames.
+    '''
+    return [idx * num_inputs // num_outputs for idx in range(num_outputs)]
+
+def group_sizes(num_inputs, num_outputs):
+    '''
+    Sizes of the consecutive input groups averaged into each output frame.
+    '''
+    bounds = [idx * num_inputs // num_outputs for idx in range(num_outputs + 1)]
+    return [end - start for start, end in zip(bounds, bounds[1:])]
+
+def blend_frames(frames, sizes):
+    '''
+    Averages each group of frames through one float32 accumulator, so memory
+    is a single frame whatever the group size. The yielded frame is reused
+    for the next group.
+    '''
+    import cv2
+    import numpy as np
+
+    frames = iter(frames)
+    accumulator = output = None
+
+    for size in sizes:
+        for idx in range(size):
+            frame = next(frames)
+            if accumulator is None:
+                accumulator = np.zeros(frame.shape, dtype=np.float32)
+                output = np.empty(frame.shape, dtype=np.uint8)
+            if idx == 0:
+                accumulator[...] = frame
+            else:
+                cv2.accumulate(frame, accumulator)
+
+        yield cv2.convertScaleAbs(accumulator, dst=output, alpha=1.0 / size)
+
+def interpolate_frames(frames, num_inputs, num_outputs):
+    '''
+    Stretches num_inputs frames to num_outputs by cross-fading neighbours.
+    Only the two frames around the current position are kept, and
+    cross-faded frames are all written to one reused array.
+    '''
+    import cv2
+    import numpy as np
+
+    frames = iter(frames)
+    output = None
+    scale = (num_inputs - 1) / (num_outputs - 1) if num_outputs > 1 else 0
+
+    previous = current = next(frames)
+    current_idx = 0
+
+    for idx in range(num_outputs):
+        position = idx * scale
+        base = min(int(position), num_inputs - 1)
+
+        while current_idx < min(base + 1, num_inputs - 1):
+            previous = current
+            current = next(frames)
+            current_idx += 1
+
+        weight = position - base
+        if current_idx == base or weight <= 0:
+            yield current if current_idx == base else previous
+        else:
+            if output is None:
+                output = np.empty(current.shape, dtype=np.uint8)
+            yield cv2.addWeighted(previous, 1.0 - weight, current, weight, 0, dst=output)
@@ -0,0 +1,95 @@
+from .pipeline import build_pipeline
+from .events import RenderMetrics
+from .video_writer import CascadeWriter, find_ffmpeg
+
+import os
+import subprocess
+import tempfile
+
+worker_control = None
+
+def init_segment_worker(control):
+    '''
+    ProcessPoolExecutor initializer. The RenderControl's events can only be
+    handed to a worker process when it starts, not with each task.
+    '''
+    global worker_control
+    worker_control = control
+
+def split_segments(filenames, count, context=0, skip_head=0, skip_tail=0):
+    '''
+    Split filenames, minus the first skip_head and last skip_tail, into at
+    most `count` contiguous, non-empty runs. Returns
+    (filenames, skip_head, skip_tail) per run, where each run is padded with
+    up to `context` neighbouring frames on either side.
+    '''
+    start = skip_head
+    stop = len(filenames) - skip_tail
+
+    count = max(1, min(count, stop - start))
+    size, remainder = divmod(stop - start, count)
+
+    segments = []
+    for idx in range(count):
+        end = start + size + (1 if idx < remainder else 0)
+        head = min(context, start)
+        tail = min(context, len(filenames) - end)
+        segments.append((filenames[start - head:end + tail], head, tail))
+        start = end
+
+    return segments
+
+def encode_segment(filenames, output_filenames, cfg, targets, skip_head=0, skip_tail=0, on_frame=None):
+    '''
+    Encode one segment to its own file per OutputTarget. Runs in a worker
+    process, so it only takes picklable arguments and returns the number of
+    frames written, the time spent per stage, the number of bytes read and
+    the number of buffers allocated. on_frame is called with the number of
+    frames written so far after each frame.
+    '''
+    metrics = RenderMetrics()
+    output_video = CascadeWriter(output_filenames, cfg, targets, metrics.timings)
+    if not output_video.isOpened():
+        raise IOError(f"Failed to open video writer: {output_filenames[0]}")
+
+    count = 0
+    try:
+        for img in build_pipeline(filenames, targets[0].dimensions, cfg, skip_head, skip_tail,
+                                  metrics=metrics):
+            if worker_control:
+                worker_control.checkpoint()
+            output_video.write(img)
+            count += 1
+            if on_frame:
+                on_frame(count)
+    finally:
+        output_video.release()
+
+    return count, metrics.timings.as_dict(), metrics.bytes_read, metrics.allocations
+
+def concat_videos(input_filenames, output_filename, ffmpeg=None):
+    '''
+    Join videos with identical codec settings into one file using ffmpeg's
+    concat demuxer. Streams are copied, not re-encoded.
+    '''
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg is required to concatenate video segments")
+
+    fd, list_filename = tempfile.mkstemp(suffix=".txt", dir=os.path.dirname(output_filename) or None)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for filename in input_filenames:
+                escaped = os.path.abspath(filename).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error",
+                        "-f", "concat", "-safe", "0",
+                        "-i", list_filename,
+                        "-c", "copy",
+                        output_filename],
+                       check=True,
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE)
+    finally:
+        os.remove(list_filename)
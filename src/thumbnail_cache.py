@@ -0,0 +1,113 @@
+from .archive import open_input, stat_input
+
+from PIL import Image, ImageOps
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+
+def create_thumbnail(path, size):
+    '''
+    Returns (thumbnail, (source width, source height))
+    '''
+    with open_input(path, buffering=-1) as f, Image.open(f) as img:
+        source_size = img.size
+        # Let the JPEG decoder downscale while decoding; still covers `size`
+        img.draft("RGB", size)
+        thumbnail = ImageOps.fit(img.convert("RGB"), size, method=Image.LANCZOS,
+                                 bleed=0.0, centering=(0.5, 0.5))
+
+    return thumbnail, source_size
+
+class ThumbnailCache:
+    '''
+    Persistent thumbnail store for one folder.
+
+    Thumbnails are kept as JPEG blobs in a single sqlite file per folder, keyed
+    by file name and invalidated when the file's byte size or mtime changes.
+    The store is capped at `max_bytes`; least recently used entries are
+    evicted first.
+    '''
+    cache_dir = os.path.join("cache", "thumbnails")
+
+    def __init__(self, folder, size=(128, 128), max_bytes=64 * 1024 * 1024):
+        self.folder = os.path.abspath(folder)
+        self.size = tuple(size)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = hashlib.sha1(f"{self.folder}|{self.size}".encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.cache_dir, f"{key}.db")
+
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS thumbs ("
+                        "name TEXT PRIMARY KEY, "
+                        "file_size INTEGER, "
+                        "mtime REAL, "
+                        "width INTEGER, "
+                        "height INTEGER, "
+                        "data BLOB, "
+                        "last_used REAL)")
+        self.db.commit()
+
+    def get(self, path):
+        '''
+        Returns (thumbnail, (source width, source height)), creating and
+        storing the thumbnail on a miss.
+        '''
+        # Archive members can be in subfolders of the archive
+        name = os.path.relpath(os.path.abspath(path), self.folder).replace(os.sep, '/')
+        file_size, mtime = stat_input(path)
+
+        with self.lock:
+            row = self.db.execute("SELECT file_size, mtime, width, height, data FROM thumbs WHERE name=?",
+                                  (name,)).fetchone()
+
+            if row and row[0] == file_size and row[1] == mtime:
+                self.db.execute("UPDATE thumbs SET last_used=? WHERE name=?", (time.time(), name))
+                thumbnail = Image.open(io.BytesIO(row[4]))
+                thumbnail.load()
+                return thumbnail, (row[2], row[3])
+
+        thumbnail, source_size = create_thumbnail(path, self.size)
+
+        data = io.BytesIO()
+        thumbnail.save(data, format="JPEG", quality=85)
+
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (name, file_size, mtime, source_size[0], source_size[1],
+                             data.getvalue(), time.time()))
+
+        return thumbnail, source_size
+
+    def evict(self):
+        total, = self.db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbs").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        # Drop down to 90% of the cap so we don't evict on every flush
+        target = total - self.max_bytes * 0.9
+        freed = 0
+        names = []
+        for name, length in self.db.execute("SELECT name, LENGTH(data) FROM thumbs ORDER BY last_used"):
+            names.append((name,))
+            freed += length
+            if freed >= target:
+                break
+
+        self.db.executemany("DELETE FROM thumbs WHERE name=?", names)
+
+    def flush(self):
+        with self.lock:
+            self.evict()
+            self.db.commit()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
@@ -1,83 +1,476 @@
+from .checkpoint import Checkpoint, chunk_filename, hash_inputs, sync_file
+from .distributed import Coordinator, parse_address
+from .draft import get_draft_config, select_draft_frames
+from .events import RenderMetrics
+from .folder_index import SORT_METHODS, get_folder_index
+from .manifest import Manifest
+from .outputs import get_output_targets
+from .pipeline import build_pipeline, get_context_frames
+from .render_control import RenderCancelled, RenderControl
+from .retime import get_target_frames, stride_indices
+from .segments import concat_videos, encode_segment, init_segment_worker, split_segments
 from .utils import video_format_to_codec, video_format_to_extension
+from .video_writer import CascadeWriter, find_ffmpeg
 
-import cv2
-import glob
-import imghdr
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import shutil
+import tempfile
+
+# Modules that load cv2 or numpy are imported by the methods that need them,
+# so creating a TimeLapseCreator (and starting the GUI or CLI) stays cheap.
 
 class TimeLapseCreator:
-    def __init__(self, logger, cfg, update_progress_bar):
+    def __init__(self, logger, cfg, metrics=None, refresh_index=True, control=None):
         self.logger = logger
-        self.cfg = cfg
-        self.update_progress_bar = update_progress_bar
+        self.cfg = get_draft_config(cfg) if cfg['draft'] else cfg
+        self.metrics = metrics or RenderMetrics()
+        self.control = control or RenderControl()
+        self.refresh_index = refresh_index
 
     def get_input_filenames(self):
-        input_dir = f'{self.cfg["input folder"]}/*'
-        filenames = glob.glob(input_dir)
-        assert len(filenames) > 0, f"{input_dir} contains no files"
-        self.logger.debug(filenames)
-        
+        self.folder_index = get_folder_index(self.cfg["input folder"], self.refresh_index)
+        filenames = self.folder_index.files(self.cfg['sort method'])
+        self.logger.debug(f"{len(filenames)} files in {self.cfg['input folder']}")
+
         return filenames
 
-    def filter_for_image_types(self, filenames):
-        return [filename for filename in filenames if imghdr.what(filename)]
+    def filter_for_image_types(self, entries):
+        return [entry.path for entry in entries if entry.type]
 
-    def get_dimensions(self, filename):
-        img = cv2.imread(filename)
+    def skip_duplicate_frames(self, entries):
+        from .dedupe import remove_duplicates
+        kept = remove_duplicates(entries,
+                                 self.cfg['input folder'],
+                                 self.cfg['dedupe threshold'],
+                                 self.cfg['decode workers'])
+        self.logger.debug(f"Skipping {len(entries) - len(kept)} near-duplicate frames")
+        return kept
+
+    def fit_to_length(self, input_filenames):
+        '''
+        Returns (input filenames, output frame count) for rendering exactly
+        cfg['length'] seconds. Dropped frames are removed from the list so
+        they're never decoded; blending and interpolation happen in the
+        pipeline.
+        '''
+        target = get_target_frames(self.cfg)
+        self.logger.debug(f"Fitting {len(input_filenames)} frames to {target} frames")
 
-        height, width, layers = img.shape
+        if target < len(input_filenames) and not self.cfg['length blend']:
+            return [input_filenames[idx] for idx in stride_indices(len(input_filenames), target)], None
+        if target == len(input_filenames):
+            return input_filenames, None
 
-        x_factor = width / self.cfg['output width']
-        y_factor = height / self.cfg['output height']
+        return input_filenames, target
 
-        if x_factor >= y_factor and x_factor > 1.0:
-            height = round(height / x_factor)
-            width  = round(width  / x_factor)
-        elif y_factor >= x_factor and y_factor > 1.0:
-            height = round(height / y_factor)
-            width  = round(width  / y_factor)
+    def get_dimensions(self, filename):
+        entry = self.folder_index.get(filename)
+        if entry and entry.dimensions:
+            width, height = entry.dimensions
+        else:
+            from .frame_reader import imread
+            img = imread(filename)
+            height, width, layers = img.shape
+        self.source_size = (width, height)
+
+        # Frames go through the pipeline at the largest output size
+        self.targets = get_output_targets(self.cfg, self.source_size)
+        for target in self.targets:
+            self.logger.debug(f"Dimensions: {target.dimensions} {target.video_format}{target.suffix}")
+        return self.targets[0].dimensions
 
-        dimensions = (width,height)
-        self.logger.debug(f"Dimensions: {dimensions}")
-        return dimensions
+    def get_encoder_settings(self):
+        from .grading import get_grade_settings, is_neutral
+        settings = {
+            'format': self.cfg['output format'],
+            'codec': self.video_codec,
+            'fps': self.cfg['fps'],
+            'dimensions': list(self.dimensions),
+        }
+        if self.cfg['encoder'] != 'opencv':
+            settings['encoder'] = [self.cfg['encoder'],
+                                   self.cfg['encoder codec'],
+                                   self.cfg['encoder preset'],
+                                   self.cfg['encoder crf']]
+        if self.cfg['deflicker']:
+            settings['deflicker window'] = self.cfg['deflicker window']
+        if not self.cfg['reduced decode']:
+            settings['reduced decode'] = False
+        if not is_neutral(self.cfg):
+            settings['grade'] = get_grade_settings(self.cfg)
+        return settings
 
     def run(self):
-        # TODO: Progress Bar
+        return self.run_and_report(self.create_time_lapse)
+
+    def run_and_report(self, task, *args):
+        succeeded = cancelled = False
+        try:
+            succeeded = task(*args)
+        except RenderCancelled:
+            self.logger.info("Render cancelled")
+            cancelled = True
+        finally:
+            self.metrics.finish(succeeded, cancelled)
+        return succeeded
+
+    def create_time_lapse(self):
         video_format = self.cfg["output format"]
-        video_codec = video_format_to_codec(video_format)
-        video_extension = video_format_to_extension(video_format)
+        self.video_codec = video_format_to_codec(video_format)
+        self.video_extension = video_format_to_extension(video_format)
+
+        if self.cfg['encoder'] == 'ffmpeg' and not find_ffmpeg():
+            self.logger.error("The ffmpeg encoder was selected but ffmpeg is not on the PATH")
+            return False
+
+        with self.metrics.timings.measure('scan'):
+            input_filenames = self.get_input_filenames()
+            input_filenames = self.filter_for_image_types(input_filenames)
+        if not input_filenames:
+            self.logger.warning(f"No photos in {self.cfg['input folder']}")
+            return False
+        if self.cfg['dedupe']:
+            entries = self.skip_duplicate_frames([self.folder_index.get(filename) for filename in input_filenames])
+            input_filenames = [entry.path for entry in entries]
+        self.control.checkpoint()
+        num_outputs = None
+        if self.cfg['fit to length']:
+            input_filenames, num_outputs = self.fit_to_length(input_filenames)
+        if self.cfg['draft']:
+            input_filenames, num_outputs, fps_scale = select_draft_frames(input_filenames, num_outputs,
+                                                                          self.cfg['draft max frames'])
+            self.cfg['fps'] *= fps_scale
+            self.logger.debug(f"Draft of {len(input_filenames)} frames at {self.cfg['fps']:.2f} fps")
+
+        self.dimensions = self.get_dimensions(input_filenames[0])
+        output_filenames = [target.get_filename(self.cfg['output folder'], self.cfg['output file'])
+                            for target in self.targets]
+        self.output_filename = next(filename for filename, target in zip(output_filenames, self.targets)
+                                    if not target.suffix)
+
+        if self.cfg['incremental']:
+            if self.cfg['fit to length']:
+                # Every frame's timing depends on the total count, nothing can be reused
+                self.logger.warning("Incremental mode is not supported with fit to length, rendering everything")
+            elif len(self.targets) > 1:
+                self.logger.warning("Incremental mode is not supported with extra outputs, rendering everything")
+            else:
+                return self.run_incremental(input_filenames, self.output_filename)
+
+        if num_outputs:
+            # Blended and interpolated frames depend on their neighbours across any split
+            if self.cfg['checkpoint']:
+                self.logger.warning("Checkpoints are not supported when blending or interpolating to a length")
+            self.metrics.start(num_outputs, self.output_filename)
+            return self.write_video(input_filenames, output_filenames, num_outputs=num_outputs)
+
+        return self.render_resumable(input_filenames, output_filenames)
 
-        input_filenames = self.get_input_filenames()
-        input_filenames = self.filter_for_image_types(input_filenames)
-        output_filename = f"{self.cfg['output folder']}/{self.cfg['output file']}.{video_extension}"
+    def render_resumable(self, input_filenames, output_filenames):
+        '''
+        render(), in checkpointed chunks if cfg['checkpoint'] is set.
+        '''
+        if self.cfg['checkpoint']:
+            if find_ffmpeg():
+                return self.render_checkpointed(input_filenames, output_filenames)
+            self.logger.warning("ffmpeg not found, rendering without checkpoints")
 
-        dimensions = self.get_dimensions(input_filenames[0])
+        self.metrics.start(len(input_filenames), self.output_filename)
+        return self.render(input_filenames, output_filenames)
 
+    def get_checkpoint_settings(self):
+        # Everything besides the input list that changes the encoded frames
+        return dict(self.get_encoder_settings(),
+                    targets=[[list(target.dimensions), target.video_format, target.suffix]
+                             for target in self.targets])
+
+    def render_checkpointed(self, input_filenames, output_filenames):
+        '''
+        Renders in chunks of cfg['checkpoint frames'] frames, each a finished
+        video in <output>.chunks, and records every completed chunk in a
+        Checkpoint. A rerun with the same inputs and settings keeps the
+        chunks that are still intact and carries on after them. The chunks
+        are joined with ffmpeg once all are done.
+        '''
+        chunk_dir = Checkpoint.dir_for(self.output_filename)
+        chunk_frames = max(1, self.cfg['checkpoint frames'])
+        settings = self.get_checkpoint_settings()
+        inputs_hash = hash_inputs([self.folder_index.get(filename) for filename in input_filenames])
+
+        checkpoint = Checkpoint.load(chunk_dir)
+        if checkpoint and checkpoint.matches(settings, inputs_hash, chunk_frames):
+            checkpoint.chunks = checkpoint.chunks[:checkpoint.count_valid(chunk_dir, self.targets)]
+            self.logger.info(f"Resuming from checkpoint at frame {checkpoint.frames_done()}")
+        else:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+            os.makedirs(chunk_dir)
+            checkpoint = Checkpoint(settings, inputs_hash, chunk_frames)
+
+        num_inputs = len(input_filenames)
+        context = get_context_frames(self.cfg)
+        first = checkpoint.frames_done()
+
+        self.metrics.start(num_inputs - first, self.output_filename)
+        for start in range(first, num_inputs, chunk_frames):
+            end = min(start + chunk_frames, num_inputs)
+            head = min(context, start)
+            tail = min(context, num_inputs - end)
+
+            idx = len(checkpoint.chunks)
+            filenames = [chunk_filename(chunk_dir, idx, target) for target in self.targets]
+            if not self.render(input_filenames[start - head:end + tail], filenames, head, tail):
+                return False
+
+            for filename in filenames:
+                sync_file(filename)
+            checkpoint.chunks.append([end - start, [os.path.getsize(filename) for filename in filenames]])
+            checkpoint.save(chunk_dir)
+
+        try:
+            with self.metrics.timings.measure('concat'):
+                for target_idx, output_filename in enumerate(output_filenames):
+                    concat_videos([chunk_filename(chunk_dir, idx, self.targets[target_idx])
+                                   for idx in range(len(checkpoint.chunks))],
+                                  output_filename)
+        except Exception as e:
+            # The chunks are kept, so a rerun only has to join them
+            self.logger.error(f"Failed to join chunks into {self.output_filename}: {e}")
+            return False
+
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        return True
+
+    def render(self, input_filenames, output_filenames, skip_head=0, skip_tail=0):
+        '''
+        Encodes input_filenames to output_filenames, one per output target.
+        The first skip_head and last skip_tail frames are only decoded as
+        context for stateful stages and are not written.
+        '''
+        if self.cfg['distributed address']:
+            if find_ffmpeg():
+                return self.run_distributed(input_filenames, output_filenames, skip_head, skip_tail)
+            self.logger.warning("ffmpeg not found, rendering on this machine")
+
+        if self.cfg['segment workers'] > 1:
+            if find_ffmpeg():
+                return self.run_segmented(input_filenames, output_filenames, skip_head, skip_tail)
+            self.logger.warning("ffmpeg not found, encoding with a single writer")
+
+        return self.write_video(input_filenames, output_filenames, skip_head, skip_tail)
+
+    def write_video(self, input_filenames, output_filenames, skip_head=0, skip_tail=0, num_outputs=None):
         self.logger.debug(f"Creating video writer, "\
-                          f"output path={output_filename}, "\
-                          f"codec={video_codec}, "\
+                          f"output paths={output_filenames}, "\
+                          f"encoder={self.cfg['encoder']}, "\
+                          f"codec={self.video_codec}, "\
                           f"fps={self.cfg['fps']}, "\
-                          f"dimensions={dimensions}")
-
-        self.logger.debug(f"Writing to {output_filename}, codec={video_codec}")
+                          f"dimensions={self.dimensions}")
 
-        video_fourcc = 0 if video_codec == 0 else cv2.VideoWriter_fourcc(*video_codec)
-        output_video = cv2.VideoWriter(output_filename, 
-                                       video_fourcc,
-                                       self.cfg['fps'],
-                                       dimensions)
+        output_video = CascadeWriter(output_filenames, self.cfg, self.targets, self.metrics.timings)
 
         if not output_video.isOpened():
             print("Failed to open video writer")
             return False
 
-        for idx, filename in enumerate(input_filenames):
-            self.logger.debug(f"{idx+1} / {len(input_filenames)}")
-            img = cv2.imread(filename)
-            img = cv2.resize(img, dimensions)
-            output_video.write(img)
+        frames = build_pipeline(input_filenames, self.dimensions, self.cfg,
+                                skip_head, skip_tail, num_outputs, self.metrics)
 
-            progress = (idx + 1) / len(input_filenames) * 100
-            self.update_progress_bar(progress)
+        try:
+            for img in frames:
+                self.control.checkpoint()
+                output_video.write(img)
+                self.metrics.frame_done()
+        except RenderCancelled:
+            output_video.release()
+            for output_filename in output_filenames:
+                os.remove(output_filename)
+            raise
 
         output_video.release()
-        return True
\ No newline at end of file
+        return True
+
+    def run_segmented(self, input_filenames, output_filenames, skip_head=0, skip_tail=0):
+        segments = split_segments(input_filenames,
+                                  self.cfg['segment workers'],
+                                  get_context_frames(self.cfg),
+                                  skip_head,
+                                  skip_tail)
+        num_frames = len(input_filenames) - skip_head - skip_tail
+        self.logger.debug(f"Encoding {num_frames} frames in {len(segments)} segments")
+
+        with tempfile.TemporaryDirectory(dir=self.cfg['output folder']) as segment_dir:
+            # segment_filenames[segment][target]
+            segment_filenames = [[os.path.join(segment_dir, f"segment_{idx:05d}{target.suffix}.{target.extension}")
+                                  for target in self.targets]
+                                 for idx in range(len(segments))]
+
+            try:
+                with ProcessPoolExecutor(max_workers=len(segments),
+                                         initializer=init_segment_worker,
+                                         initargs=(self.control,)) as pool:
+                    futures = [pool.submit(encode_segment,
+                                           segment,
+                                           segment_filename,
+                                           self.cfg,
+                                           self.targets,
+                                           segment_head,
+                                           segment_tail)
+                               for (segment, segment_head, segment_tail), segment_filename
+                               in zip(segments, segment_filenames)]
+
+                    for future in as_completed(futures):
+                        frames_written, segment_timings, bytes_read, allocations = future.result()
+                        self.metrics.timings.merge(segment_timings)
+                        self.metrics.add_bytes_read(bytes_read)
+                        self.metrics.add_allocations(allocations)
+                        self.metrics.frame_done(frames_written)
+
+                with self.metrics.timings.measure('concat'):
+                    for idx, output_filename in enumerate(output_filenames):
+                        concat_videos([filenames[idx] for filenames in segment_filenames], output_filename)
+            except RenderCancelled:
+                raise
+            except Exception as e:
+                self.logger.error(f"Segmented encode failed: {e}")
+                return False
+
+        return True
+
+    def run_distributed(self, input_filenames, output_filenames, skip_head=0, skip_tail=0):
+        '''
+        Like run_segmented, but the segments are encoded by workers that
+        connect to a Coordinator listening on cfg['distributed address'].
+        '''
+        num_frames = len(input_filenames) - skip_head - skip_tail
+        segment_frames = max(1, self.cfg['distributed segment frames'])
+        segments = split_segments(input_filenames,
+                                  -(-num_frames // segment_frames),
+                                  get_context_frames(self.cfg),
+                                  skip_head,
+                                  skip_tail)
+        self.logger.debug(f"Distributing {num_frames} frames in {len(segments)} segments")
+
+        input_folder = os.path.abspath(self.cfg['input folder'])
+        targets = [[list(target.dimensions), target.video_format, target.suffix] for target in self.targets]
+        tasks = [{'cfg': self.cfg.d,
+                  'folder': input_folder,
+                  'filenames': [os.path.relpath(filename, input_folder) for filename in segment],
+                  'targets': targets,
+                  'skip head': segment_head,
+                  'skip tail': segment_tail}
+                 for segment, segment_head, segment_tail in segments]
+
+        coordinator = Coordinator(self.logger,
+                                  parse_address(self.cfg['distributed address']),
+                                  self.cfg['distributed token'],
+                                  self.cfg['distributed attempts'])
+
+        with tempfile.TemporaryDirectory(dir=self.cfg['output folder']) as segment_dir:
+            segment_filenames = [[os.path.join(segment_dir, f"segment_{idx:05d}{target.suffix}.{target.extension}")
+                                  for target in self.targets]
+                                 for idx in range(len(segments))]
+
+            try:
+                coordinator.render(tasks, segment_filenames, self.metrics, self.control)
+
+                with self.metrics.timings.measure('concat'):
+                    for idx, output_filename in enumerate(output_filenames):
+                        concat_videos([filenames[idx] for filenames in segment_filenames], output_filename)
+            except RenderCancelled:
+                raise
+            except Exception as e:
+                self.logger.error(f"Distributed encode failed: {e}")
+                return False
+
+        return True
+
+    def run_incremental(self, input_filenames, output_filename):
+        settings = self.get_encoder_settings()
+        entries = [self.folder_index.get(filename) for filename in input_filenames]
+
+        manifest = Manifest.load(output_filename)
+        num_encoded = 0
+        if manifest and os.path.exists(output_filename):
+            num_encoded = manifest.count_encoded(settings, entries)
+
+        if num_encoded == 0 or not find_ffmpeg():
+            if num_encoded:
+                self.logger.warning("ffmpeg not found, re-rendering the whole time lapse")
+            self.logger.debug(f"Full render of {len(input_filenames)} frames to {output_filename}")
+
+            if not self.render_resumable(input_filenames, [output_filename]):
+                return False
+            Manifest.from_entries(settings, entries).save(output_filename)
+            return True
+
+        return self.append_frames(manifest, entries[num_encoded:], output_filename)
+
+    def append(self, new_filenames):
+        '''
+        Appends frames to the video written by the last incremental run()
+        without rescanning the input folder.
+        '''
+        return self.run_and_report(self.append_new_frames, new_filenames)
+
+    def append_new_frames(self, new_filenames):
+        if self.cfg['fit to length']:
+            self.logger.error("Can't append to a video fitted to a length")
+            return False
+        if len(self.targets) > 1:
+            self.logger.error("Can't append to a render with extra outputs")
+            return False
+
+        manifest = Manifest.load(self.output_filename)
+        if not manifest or manifest.settings != self.get_encoder_settings():
+            self.logger.error(f"No matching manifest for {self.output_filename}")
+            return False
+
+        encoded = set(frame[0] for frame in manifest.frames)
+        names = sorted(os.path.basename(filename) for filename in new_filenames)
+        entries = [entry for entry in self.folder_index.update(names)
+                   if entry.type and entry.name not in encoded]
+        entries.sort(key=SORT_METHODS[self.cfg['sort method']])
+
+        if self.cfg['dedupe'] and entries:
+            # Compare against the last frame already in the video
+            last_encoded = self.folder_index.get(manifest.frames[-1][0])
+            if last_encoded:
+                entries = self.skip_duplicate_frames([last_encoded] + entries)[1:]
+            else:
+                entries = self.skip_duplicate_frames(entries)
+
+        return self.append_frames(manifest, entries, self.output_filename)
+
+    def append_frames(self, manifest, new_entries, output_filename):
+        self.logger.debug(f"{len(manifest.frames)} frames already encoded, appending {len(new_entries)}")
+        if not new_entries:
+            return True
+
+        with tempfile.TemporaryDirectory(dir=self.cfg['output folder']) as segment_dir:
+            segment_filename = os.path.join(segment_dir, f"append.{self.video_extension}")
+            joined_filename = os.path.join(segment_dir, f"joined.{self.video_extension}")
+
+            # Frames already in the video give stateful stages their lead-in
+            context = [self.folder_index.get(frame[0]) for frame in manifest.frames[-get_context_frames(self.cfg):]] \
+                if get_context_frames(self.cfg) else []
+            context = [entry.path for entry in context if entry]
+
+            self.metrics.start(len(new_entries), output_filename)
+            if not self.render(context + [entry.path for entry in new_entries], [segment_filename],
+                               skip_head=len(context)):
+                return False
+
+            try:
+                with self.metrics.timings.measure('concat'):
+                    concat_videos([output_filename, segment_filename], joined_filename)
+            except Exception as e:
+                self.logger.error(f"Failed to append to {output_filename}: {e}")
+                return False
+
+            # Atomic, so readers always see a complete, playable file
+            os.replace(joined_filename, output_filename)
+
+        manifest.append(new_entries)
+        manifest.save(output_filename)
+        return True
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+import threading
+import time
+
+class StageTimings:
+    '''
+    Accumulates wall time per render stage. Safe to share between the
+    decode worker threads.
+    '''
+    def __init__(self):
+        self.seconds = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def merge(self, seconds):
+        for stage, value in seconds.items():
+            self.add(stage, value)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def as_dict(self):
+        with self.lock:
+            return dict(self.seconds)
@@ -1,18 +1,6 @@
-import glob
-import imghdr
-
-def get_photos_in_folder(folder):
-    filenames = glob.glob(f"{folder}/*")
-    
-    res = []
-    for filename in filenames:
-        try:
-            if imghdr.what(filename):
-                res.append(filename)
-        except:
-            continue
-
-    return res
+def get_photos_in_folder(folder, refresh=True):
+    from .folder_index import get_folder_index
+    return get_folder_index(folder, refresh).photo_paths()
 
 format_dict = {
     "avi": {
@@ -26,6 +14,10 @@ format_dict = {
     "avi(raw)": {
         "codec": 0,
         "extension": "avi"
+    },
+    "avi(mjpeg)": {
+        "codec": "MJPG",
+        "extension": "avi"
     }
 }
 
@@ -0,0 +1,145 @@
+from .utils import video_format_to_codec
+
+import shutil
+import subprocess
+
+# cv2 and numpy are imported where a writer needs them, so find_ffmpeg and
+# the encoder list stay cheap to import
+
+def find_ffmpeg():
+    return shutil.which("ffmpeg")
+
+class OpenCVWriter:
+    '''
+    cv2.VideoWriter with the fourcc picked from the output format. The
+    other backends copy its isOpened / write / release interface.
+    '''
+    def __init__(self, filename, cfg, dimensions, video_format):
+        import cv2
+        video_codec = video_format_to_codec(video_format)
+        video_fourcc = 0 if video_codec == 0 else cv2.VideoWriter_fourcc(*video_codec)
+        self.writer = cv2.VideoWriter(filename,
+                                      video_fourcc,
+                                      cfg['fps'],
+                                      dimensions)
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+class FfmpegWriter:
+    '''
+    Streams raw BGR frames into an ffmpeg process over stdin, so any encoder
+    ffmpeg was built with can be used. Nothing is written to disk but the
+    output file.
+    '''
+    def __init__(self, filename, cfg, dimensions, video_format):
+        self.filename = filename
+        self.process = None
+
+        ffmpeg = find_ffmpeg()
+        if not ffmpeg:
+            return
+
+        width, height = dimensions
+        command = [ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24",
+                   "-s", f"{width}x{height}", "-r", str(cfg['fps']),
+                   "-i", "-",
+                   "-an"]
+
+        if video_format_to_codec(video_format) == 0:
+            command += ["-c:v", "rawvideo", "-pix_fmt", "bgr24"]
+        else:
+            command += ["-c:v", cfg['encoder codec']]
+            if cfg['encoder preset']:
+                command += ["-preset", cfg['encoder preset']]
+            if cfg['encoder crf'] is not None:
+                command += ["-crf", str(cfg['encoder crf'])]
+            command += ["-threads", str(cfg['encoder threads']), "-pix_fmt", "yuv420p"]
+            if width % 2 or height % 2:
+                # 4:2:0 chroma needs even dimensions, pad with one black row/column
+                command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+
+        command.append(filename)
+        self.process = subprocess.Popen(command,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+        except BrokenPipeError:
+            self.release()
+
+    def release(self):
+        if self.process is None:
+            return
+
+        process, self.process = self.process, None
+        _, errors = process.communicate()
+        if process.returncode != 0:
+            raise IOError(f"ffmpeg failed to encode {self.filename}: {errors.decode(errors='replace').strip()}")
+
+encoders = {
+    "opencv": OpenCVWriter,
+    "ffmpeg": FfmpegWriter,
+}
+
+def open_video_writer(filename, cfg, dimensions, video_format=None):
+    return encoders[cfg['encoder']](filename, cfg, dimensions, video_format or cfg['output format'])
+
+class CascadeWriter:
+    '''
+    Writes every frame to one video per OutputTarget. Targets are ordered
+    largest first and each smaller resolution is resized from the one
+    before it, into a buffer that is reused for every frame. Time spent is
+    added to timings under 'encode' and 'resize'.
+    '''
+    def __init__(self, filenames, cfg, targets, timings):
+        self.writers = [open_video_writer(filename, cfg, target.dimensions, target.video_format)
+                        for filename, target in zip(filenames, targets)]
+        self.dimensions = [target.dimensions for target in targets]
+        self.buffers = [None] * len(targets)
+        self.timings = timings
+
+    def isOpened(self):
+        return all(writer.isOpened() for writer in self.writers)
+
+    def resize(self, frame, idx):
+        import cv2
+        import numpy as np
+        width, height = self.dimensions[idx]
+        if frame.shape[:2] == (height, width):
+            return frame
+
+        if self.buffers[idx] is None:
+            self.buffers[idx] = np.empty((height, width, 3), dtype=np.uint8)
+        return cv2.resize(frame, (width, height), dst=self.buffers[idx], interpolation=cv2.INTER_AREA)
+
+    def write(self, frame):
+        for idx, writer in enumerate(self.writers):
+            if idx:
+                with self.timings.measure('resize'):
+                    frame = self.resize(frame, idx)
+            with self.timings.measure('encode'):
+                writer.write(frame)
+
+    def release(self):
+        error = None
+        for writer in self.writers:
+            try:
+                writer.release()
+            except IOError as e:
+                error = error or e
+        if error:
+            raise error
@@ -0,0 +1,192 @@
+from .time_lapse_creator import TimeLapseCreator
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0x00000800
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+def load_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+class FolderWatcher:
+    '''
+    Reports files that appear in a folder.
+
+    Uses inotify where available, so files are reported once they've been
+    fully written (closed or moved in). Elsewhere it falls back to checking
+    the folder's mtime every poll and only lists the folder when that
+    changed; new files are reported once their size stops changing.
+    '''
+    def __init__(self, folder, poll_interval=2.0):
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.fd = None
+
+        libc = load_inotify()
+        if libc:
+            fd = libc.inotify_init1(IN_NONBLOCK)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+
+        if self.fd is None:
+            self.folder_mtime = os.stat(folder).st_mtime_ns
+            self.known = set(os.listdir(folder))
+            self.growing = {}  # name -> size seen on the previous poll
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def wait(self, timeout):
+        '''
+        Blocks for up to timeout seconds and returns the names of new files.
+        '''
+        if self.fd is not None:
+            return self.read_events(timeout)
+
+        time.sleep(min(timeout, self.poll_interval))
+        return self.poll()
+
+    def read_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        names = []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+
+        pos = 0
+        while pos + INOTIFY_EVENT_HEADER.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT_HEADER.unpack_from(data, pos)
+            pos += INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+
+            if name and not name.startswith('.'):
+                names.append(name)
+
+        return names
+
+    def poll(self):
+        names = []
+
+        # Files still being written: report them once their size settles
+        for name, size in list(self.growing.items()):
+            try:
+                current = os.stat(os.path.join(self.folder, name)).st_size
+            except OSError:
+                del self.growing[name]
+                continue
+
+            if current == size:
+                del self.growing[name]
+                names.append(name)
+            else:
+                self.growing[name] = current
+
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return names
+        if folder_mtime == self.folder_mtime:
+            return names
+        self.folder_mtime = folder_mtime
+
+        current = set(os.listdir(self.folder))
+        for name in current - self.known:
+            if name.startswith('.'):
+                continue
+            try:
+                self.growing[name] = os.stat(os.path.join(self.folder, name)).st_size
+            except OSError:
+                continue
+        self.known = current
+
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class LiveRenderer:
+    '''
+    Long-running render that follows cfg["input folder"].
+
+    New images reported by FolderWatcher are queued and, every
+    publish_interval seconds, encoded into a new segment and joined onto the
+    output (see TimeLapseCreator.append). Earlier frames are never
+    re-encoded and the folder is never rescanned.
+    '''
+    def __init__(self, logger, cfg, metrics, publish_interval=600, poll_interval=2.0):
+        self.logger = logger
+        self.cfg = cfg
+        self.cfg['incremental'] = True
+        self.metrics = metrics
+        self.publish_interval = publish_interval
+        self.poll_interval = poll_interval
+        self.creator = None
+
+    def publish(self, new_filenames):
+        if self.creator is None:
+            creator = TimeLapseCreator(self.logger, self.cfg, self.metrics)
+            succeeded = creator.run()
+            if succeeded:
+                self.creator = creator
+            return succeeded
+
+        if not new_filenames:
+            return True
+
+        return self.creator.append(new_filenames)
+
+    def run(self, stop_event=None):
+        watcher = FolderWatcher(self.cfg['input folder'], self.poll_interval)
+        self.logger.info(f"Watching {self.cfg['input folder']} "
+                         f"({'inotify' if watcher.uses_inotify else 'polling'}), "
+                         f"publishing every {self.publish_interval}s")
+
+        pending = set()
+        try:
+            # Catch up with whatever is already in the folder
+            self.publish([])
+            next_publish = time.monotonic() + self.publish_interval
+
+            while not (stop_event and stop_event.is_set()):
+                remaining = max(0.0, next_publish - time.monotonic())
+                pending.update(watcher.wait(min(remaining, self.poll_interval)))
+
+                if time.monotonic() < next_publish:
+                    continue
+
+                if pending or self.creator is None:
+                    self.logger.info(f"Publishing {len(pending)} new frames")
+                    if self.publish(sorted(pending)):
+                        pending.clear()
+
+                next_publish = time.monotonic() + self.publish_interval
+        finally:
+            watcher.close()